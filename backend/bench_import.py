@@ -0,0 +1,73 @@
+"""
+Import-Zeit-Benchmark für src.main (Kaltstart eines Workers).
+
+Jeder Lauf importiert das Modul in einem frischen Interpreter. Gemeldet werden Median und
+Maximum; der Exit-Code ist 1, wenn der Median das Budget überschreitet oder eine der
+schweren Abhängigkeiten schon beim Import geladen wird.
+
+    python bench_import.py --runs 10 --budget-ms 1000
+    python bench_import.py --importtime 15   # die langsamsten Module laut -X importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+LAZY_MODULES = ["paramiko", "requests", "fritzconnection", "numpy"] # Dürfen erst bei Bedarf importiert werden
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import src.main
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+def _run_probe() -> dict:
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def _slowest_imports(limit: int):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import src.main"],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return sorted(rows, reverse=True)[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description="Misst die Import-Zeit von src.main.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_BUDGET_MS", "1000")))
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="Zeigt die N langsamsten Module")
+    args = parser.parse_args()
+
+    _run_probe() # Aufwärmen (Bytecode-Cache)
+    samples = [_run_probe() for _ in range(args.runs)]
+    timings = [sample["ms"] for sample in samples]
+    loaded = sorted({module for sample in samples for module in sample["loaded"]})
+    median = statistics.median(timings)
+    print(f"import src.main: median {median:.0f} ms, max {max(timings):.0f} ms ({args.runs} runs, budget {args.budget_ms:.0f} ms)")
+
+    if args.importtime:
+        print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+        for cumulative_us, self_us, module in _slowest_imports(args.importtime):
+            print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {module}")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: eagerly imported: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget_ms:
+        print("FAIL: median import time exceeds the budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
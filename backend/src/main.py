@@ -1,48 +1,230 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fritzconnection import FritzConnection
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, text, create_engine, Column, Integer, Float, String, Text, DateTime, Boolean, ForeignKey, UniqueConstraint, func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, declarative_base # Angepasster Import
-import paramiko
 import os
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional, Set
-from pydantic import BaseModel
-import requests
+import asyncio
+import codecs
+import concurrent.futures
+import hashlib
+import importlib
+import random
+import socket
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Set, Tuple
+from pydantic import BaseModel, ValidationError
+import csv
+import io
 import json
+import gzip
+import re
 import shlex # Import shlex for proper shell quoting
 
+# Optionale Beschleuniger für kompakte Stats-Antworten
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class _LazyModule:
+    """
+    Platzhalter für schwere Abhängigkeiten: das Modul wird erst beim ersten Attributzugriff
+    importiert, damit Worker, die es nie brauchen, schneller starten.
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+paramiko = _LazyModule("paramiko")
+requests = _LazyModule("requests")
+np = _LazyModule("numpy")
+
 # Logger Setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("backend-app")
 
-app = FastAPI()
-
-# CORS Middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*", "http://localhost:3000", "http://10.0.0.107:3000"],  # Erlaubt alle Ursprünge, aber du kannst hier spezifische URLs angeben
-    allow_origin_regex="https?://.*",  # Erlaubt alle HTTP/HTTPS Ursprünge
-    max_age=3600,  # Caching der CORS-Preflight-Anfrage
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
 
-# Database setup
+# Database setup – Engine und Tabellen werden erst beim Start der App angelegt (siehe create_app)
 SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./test.db")
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
-# Fritz!Box Connection
+def get_engine():
+    """Legt die Engine beim ersten Aufruf an und bindet SessionLocal daran (verbindet noch nicht)."""
+    global engine
+    if engine is None:
+        engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+        SessionLocal.configure(bind=engine)
+    return engine
+
+def init_db():
+    Base.metadata.create_all(bind=get_engine())
+
+# === LAZY CLIENTS (SSH POOL, NETDATA, FRITZ!BOX) ===
+
+SSH_POOL_IDLE_TIMEOUT = float(os.environ.get("SSH_POOL_IDLE_TIMEOUT", "120")) # Sekunden
+SSH_POOL_MAX_IDLE_PER_HOST = int(os.environ.get("SSH_POOL_MAX_IDLE_PER_HOST", "2"))
+SSH_POOL_PROBE_TIMEOUT = 5.0 # Sekunden; Prüfung einer wiederverwendeten Verbindung
+
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+def _lazy_client(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+class SSHConnectionPool:
+    """
+    Hält freie SSH-Verbindungen pro Server (ID, Host, User) offen, damit wiederkehrende
+    Abfragen (Stats, getent, User-Verwaltung) nicht jedes Mal neu verbinden.
+    Thread-sicher, da die Verbindungen aus dem Threadpool genutzt werden.
+    """
+    def __init__(self, idle_timeout: float, max_idle_per_host: int):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_host = max_idle_per_host
+        # key -> [(client, freigegeben um, Passwort-Fingerprint)]
+        self._idle: Dict[Tuple[Optional[int], str, str], List[Tuple[object, float, str]]] = {}
+        self._lock = threading.Lock()
+        self._salt = os.urandom(16)
+
+    def _key(self, server: "Server"):
+        return getattr(server, "id", None), server.ip_address, server.ssh_user
+
+    def _fingerprint(self, server: "Server") -> str:
+        # Nur ein gesalzener Hash, damit geänderte Passwörter alte Verbindungen verwerfen
+        return hashlib.sha256(self._salt + (server.ssh_password or "").encode()).hexdigest()
+
+    def _checkout(self, key, fingerprint: str):
+        now = time.monotonic()
+        stale = []
+        client = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, released_at, candidate_fingerprint = idle.pop()
+                transport = candidate.get_transport()
+                if (candidate_fingerprint == fingerprint and now - released_at < self.idle_timeout
+                        and transport is not None and transport.is_active()):
+                    client = candidate
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            candidate.close()
+        return client
+
+    def _checkin(self, key, fingerprint: str, client):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((client, time.monotonic(), fingerprint))
+                return
+        client.close()
+
+    def _is_alive(self, client) -> bool:
+        """
+        is_active() sieht nicht, ob die Gegenseite die Verbindung längst verworfen hat (Reboot,
+        NAT-Timeout, ClientAlive); erst ein neuer Kanal zeigt das.
+        """
+        try:
+            client.get_transport().open_session(timeout=SSH_POOL_PROBE_TIMEOUT).close()
+            return True
+        except (paramiko.SSHException, EOFError, OSError):
+            return False
+
+    @contextmanager
+    def connection(self, server: "Server", timeout: float = 10):
+        key, fingerprint = self._key(server), self._fingerprint(server)
+        ssh = self._checkout(key, fingerprint)
+        if ssh is not None and not self._is_alive(ssh):
+            # Einmal mit einer frischen Verbindung versuchen, statt den Fehler an den Aufrufer zu geben
+            logger.info(f"[SSH-POOL] Wiederverwendete Verbindung zu {server.ip_address} ist tot, verbinde neu.")
+            ssh.close()
+            ssh = None
+        if ssh is None:
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                ssh.connect(server.ip_address, username=server.ssh_user, password=server.ssh_password, timeout=timeout)
+            except Exception:
+                ssh.close()
+                raise
+        try:
+            yield ssh
+        except BaseException:
+            ssh.close() # Zustand der Sitzung unklar, nicht wiederverwenden
+            raise
+        self._checkin(key, fingerprint, ssh)
+
+    def discard(self, server_id: int):
+        """Schließt die freien Verbindungen eines Servers (z.B. nach geänderten Zugangsdaten)."""
+        with self._lock:
+            keys = [key for key in self._idle if key[0] == server_id]
+            clients = [client for key in keys for client, _, _ in self._idle.pop(key)]
+        for client in clients:
+            client.close()
+
+    def close(self):
+        with self._lock:
+            clients = [client for idle in self._idle.values() for client, _, _ in idle]
+            self._idle.clear()
+        for client in clients:
+            client.close()
+
+def get_ssh_pool() -> SSHConnectionPool:
+    return _lazy_client("ssh_pool", lambda: SSHConnectionPool(SSH_POOL_IDLE_TIMEOUT, SSH_POOL_MAX_IDLE_PER_HOST))
+
+def _discard_pooled_connections(server_id: int):
+    pool = _clients.get("ssh_pool")
+    if pool is not None:
+        pool.discard(server_id)
+
+def get_netdata_session():
+    """Eine requests-Session pro Prozess, damit die Netdata-Abfragen Keep-Alive nutzen."""
+    return _lazy_client("netdata", lambda: requests.Session())
+
+# Fritz!Box Connection – FritzConnection lädt beim Anlegen die Gerätebeschreibungen, daher nur einmal
 def get_fritz_connection():
-    return FritzConnection(
-        address=os.environ["FRITZ_IP"],
-        user=os.environ["FRITZ_USER"],
-        password=os.environ["FRITZ_PASSWORD"]
-    )
+    def connect():
+        from fritzconnection import FritzConnection
+        return FritzConnection(
+            address=os.environ["FRITZ_IP"],
+            user=os.environ["FRITZ_USER"],
+            password=os.environ["FRITZ_PASSWORD"]
+        )
+    return _lazy_client("fritz", connect)
+
+def close_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if callable(close):
+            close()
 
 # Database Models
 class Server(Base):
@@ -54,7 +236,102 @@ class Server(Base):
     ssh_password = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-Base.metadata.create_all(bind=engine)
+# Aggregierter Identitäts-Index (User/Gruppen aller Server), wird vom Collector gepflegt
+class IdentityUser(Base):
+    __tablename__ = "identity_users"
+    __table_args__ = (UniqueConstraint("server_id", "username"),)
+    id = Column(Integer, primary_key=True)
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), index=True)
+    username = Column(String, index=True)
+    uid = Column(Integer, index=True)
+    gid = Column(Integer) # Primary GID
+    is_admin = Column(Boolean, default=False)
+    groups = Column(String, default="") # Comma-separated group names (explicit memberships)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class IdentityGroup(Base):
+    __tablename__ = "identity_groups"
+    __table_args__ = (UniqueConstraint("server_id", "name"),)
+    id = Column(Integer, primary_key=True)
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), index=True)
+    name = Column(String, index=True)
+    gid = Column(Integer, index=True)
+    members = Column(String, default="") # Comma-separated usernames
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class IdentitySnapshot(Base):
+    __tablename__ = "identity_snapshots"
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), primary_key=True)
+    digest = Column(String) # sha256 over getent passwd + getent group
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+# Ergebnisse der Netzwerk-Discovery (Fritz!Box-Hostliste + Port-Probing)
+class DiscoveredHost(Base):
+    __tablename__ = "discovered_hosts"
+    id = Column(Integer, primary_key=True, index=True)
+    ip_address = Column(String, unique=True, index=True)
+    mac = Column(String)
+    hostname = Column(String)
+    active = Column(Boolean, default=True)
+    ssh_open = Column(Boolean, default=False)
+    ssh_banner = Column(String, nullable=True)
+    cockpit_open = Column(Boolean, default=False)
+    netdata_open = Column(Boolean, default=False)
+    first_seen = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow)
+    last_probed = Column(DateTime, nullable=True)
+
+# Gemeinsamer Stats-Cache aller Worker (nur der Collector-Leader fragt die Hosts regelmäßig ab)
+class StatsCacheEntry(Base):
+    __tablename__ = "stats_cache"
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), primary_key=True)
+    payload = Column(Text) # SystemStats as JSON
+    collected_at = Column(DateTime, default=datetime.utcnow)
+
+# Wann ein Server zuletzt über die API angesehen wurde (steuert die Poll-Frequenz)
+class ServerInterest(Base):
+    __tablename__ = "server_interest"
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), primary_key=True)
+    last_viewed_at = Column(DateTime, default=datetime.utcnow)
+
+# Schwellwert-Regeln für Alerts über die gesamte Flotte
+class AlertRule(Base):
+    __tablename__ = "alert_rules"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    metric = Column(String) # Key of ALERT_METRICS, e.g. gpu.temperature
+    operator = Column(String, default=">")
+    threshold = Column(Float)
+    duration_seconds = Column(Float, default=0) # Condition must hold this long before the alert fires
+    severity = Column(String, default="warning")
+    enabled = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Aktuell ausgelöste Alerts (eine Zeile pro Regel und Serie, dedupliziert)
+class ActiveAlert(Base):
+    __tablename__ = "active_alerts"
+    __table_args__ = (UniqueConstraint("rule_id", "server_id", "series"),)
+    id = Column(Integer, primary_key=True)
+    rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="CASCADE"), index=True)
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), index=True)
+    series = Column(String, default="") # GPU or mountpoint, empty for host metrics
+    value = Column(Float) # Value when the alert fired
+    since = Column(DateTime) # Start of the breach
+
+# Lease für die Collector-Leader-Wahl zwischen mehreren uvicorn-Workern
+class CollectorLease(Base):
+    __tablename__ = "collector_leases"
+    name = Column(String, primary_key=True)
+    holder = Column(String)
+    expires_at = Column(DateTime)
+
+# Laufende Fleet-Befehle; DELETE /commands/{run_id} setzt das Flag, der streamende Worker fragt es ab
+class FleetRun(Base):
+    __tablename__ = "fleet_runs"
+    run_id = Column(String, primary_key=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    cancel_requested = Column(Boolean, default=False)
 
 # Pydantic Models
 class ServerCreate(BaseModel):
@@ -79,6 +356,20 @@ class ServerResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class ServerImportRow(BaseModel):
+    row: int # 1-based position in the uploaded inventory
+    name: Optional[str] = None
+    ip_address: Optional[str] = None
+    status: str # created, invalid, duplicate, conflict, ssh_failed
+    detail: Optional[str] = None
+    server_id: Optional[int] = None
+    software_installed: Optional[bool] = None
+
+class ServerImportResult(BaseModel):
+    created: int
+    failed: int
+    rows: List[ServerImportRow]
+
 # Pydantic Models for Users and Groups
 class UserCreate(BaseModel):
     username: str
@@ -114,6 +405,133 @@ class GroupResponse(BaseModel):
     id: int # GID from getent group
     name: str
 
+# Pydantic Models for declarative reconciliation
+class DesiredUser(BaseModel):
+    username: str
+    password: Optional[str] = None # Only used when the user has to be created
+    uid: Optional[int] = None
+    is_admin: Optional[bool] = None # None leaves sudo/admin membership untouched
+    group_names: Optional[List[str]] = None # Exact set of secondary groups, None leaves them untouched
+
+class DesiredGroup(BaseModel):
+    name: str
+    gid: Optional[int] = None
+
+class ReconcileRequest(BaseModel):
+    users: List[DesiredUser] = []
+    groups: List[DesiredGroup] = []
+    prune_users: bool = False # Remove regular users (UID >= 1000) that are not listed
+    prune_groups: bool = False # Remove regular groups (GID >= 1000) that are not listed
+    dry_run: bool = False
+
+class ReconcileChange(BaseModel):
+    action: str # create_group, update_group, create_user, set_password, update_user, add_groups, remove_group, delete_user, delete_group
+    target: str
+    command: str # Never contains secrets, passwords are sent over stdin
+
+class ReconcileResult(BaseModel):
+    server_id: int
+    dry_run: bool
+    converged: bool # True if the server already matched the desired state
+    applied: bool
+    changes: List[ReconcileChange]
+
+class FleetCommandRequest(BaseModel):
+    server_ids: List[int]
+    command: str
+    sudo: bool = False
+    timeout: float = 300 # Seconds per host, including connect
+    max_output_bytes: int = 1024 * 1024 # Per host, stdout and stderr combined
+
+class ServerSuggestion(BaseModel):
+    name: str
+    ip_address: str
+
+class DiscoveredHostResponse(BaseModel):
+    ip_address: str
+    mac: Optional[str] = None
+    hostname: Optional[str] = None
+    active: bool
+    ssh_open: bool
+    ssh_banner: Optional[str] = None
+    cockpit_open: bool
+    netdata_open: bool
+    registered: bool # A Server with this IP already exists
+    suggested_server: Optional[ServerSuggestion] = None # Set for unregistered hosts answering with an SSH banner
+    first_seen: datetime
+    last_seen: datetime
+    last_probed: Optional[datetime] = None
+
+class DiscoveryRunResult(BaseModel):
+    hosts: int # Active hosts reported by the Fritz!Box
+    probed: int # Hosts that were (re)probed in this run
+    candidates: int # Unregistered hosts answering with an SSH banner
+
+class AlertRuleCreate(BaseModel):
+    name: str
+    metric: str # cpu_percent, memory_percent, gpu.utilization, gpu.temperature, gpu.memory_percent, gpu.power_draw, disk.use_percent
+    operator: str = ">"
+    threshold: float
+    duration_seconds: float = 0
+    severity: str = "warning"
+    enabled: bool = True
+
+class AlertRuleResponse(AlertRuleCreate):
+    id: int
+
+    class Config:
+        orm_mode = True
+
+class ActiveAlertResponse(BaseModel):
+    rule_id: int
+    rule_name: str
+    severity: str
+    metric: str
+    operator: str
+    threshold: float
+    server_id: int
+    server_name: str
+    series: str # GPU or mountpoint, empty for host metrics
+    value: float
+    since: datetime
+
+class IdentityUserEntry(BaseModel):
+    server_id: int
+    server_name: str
+    uid: int
+    gid: Optional[int] = None
+    is_admin: bool
+    groups: List[str]
+
+class IdentityUserResponse(BaseModel):
+    username: str
+    uid_collision: bool # Same username with different UIDs across servers
+    uid_shared_with: List[str] = [] # Other usernames using one of these UIDs on any server
+    servers: List[IdentityUserEntry]
+
+class IdentityGroupEntry(BaseModel):
+    server_id: int
+    server_name: str
+    gid: int
+    members: List[str]
+
+class IdentityGroupResponse(BaseModel):
+    name: str
+    gid_collision: bool # Same group name with different GIDs across servers
+    gid_shared_with: List[str] = [] # Other group names using one of these GIDs on any server
+    servers: List[IdentityGroupEntry]
+
+class IdentityAssignment(BaseModel):
+    server_id: int
+    server_name: str
+    name: str
+    id: int
+
+class IdentityCollision(BaseModel):
+    kind: str # uid_mismatch, uid_conflict, gid_mismatch, gid_conflict
+    subject: str # Username/group name (mismatch) or numeric ID (conflict)
+    assignments: List[IdentityAssignment]
+
 class GpuStats(BaseModel):
     name: str
     utilization_gpu: float
@@ -132,6 +550,26 @@ class ActiveUser(BaseModel):
     login_time: Optional[str] = None
     idle_time: Optional[str] = None
     what: Optional[str] = None
+    # Resource usage of all processes of this user (from the host-side accounting)
+    cpu_percent: Optional[float] = None
+    rss_mb: Optional[float] = None
+    gpu_memory_mb: Optional[float] = None
+    process_count: Optional[int] = None
+
+class UserResourceUsage(BaseModel):
+    username: str
+    cpu_percent: float # Sum of ps %CPU over the user's processes
+    rss_mb: float
+    gpu_memory_mb: float = 0
+    process_count: int
+
+class ProcessUsage(BaseModel):
+    pid: int
+    username: str
+    cpu_percent: float
+    rss_mb: float
+    gpu_memory_mb: Optional[float] = None
+    command: str
 
 class DiskPartition(BaseModel):
     name: str
@@ -171,51 +609,50 @@ class SystemStats(BaseModel):
     gpu_stats: List[GpuStats]
     active_users: List[ActiveUser]
     disk_partitions: List[DiskPartition] # Add disk information
+    user_usage: List[UserResourceUsage] = [] # CPU/RAM/GPU memory aggregated per user on the host
+    top_processes: List[ProcessUsage] = []
+    collected_at: Optional[datetime] = None # Zeitpunkt der Abfrage; gecachte Werte können älter sein
 
 
 # === UNVERÄNDERTE ENDPUNKTE ===
 
-@app.get("/hosts")
+@router.get("/hosts")
 async def get_hosts():
     try:
-        fc = get_fritz_connection()
-        hosts = fc.call_action("Hosts", "GetHostList")
+        hosts = await run_in_threadpool(_cached_fritz_hosts) # Gleicher Cache wie die Discovery
         return {"hosts": hosts}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # SSH Command Execution Helper
 async def _execute_ssh_command(server: Server, command: str, sudo_password: Optional[str] = None):
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
-        ssh.connect(server.ip_address, username=server.ssh_user, password=server.ssh_password, timeout=10)
-        
-        if sudo_password:
-            # Use shlex.quote to properly escape the password for the shell
-            quoted_password = shlex.quote(sudo_password)
-            full_command = f"echo {quoted_password} | sudo -S {command}"
-            stdin, stdout, stderr = ssh.exec_command(full_command, get_pty=True)
-        else:
-            stdin, stdout, stderr = ssh.exec_command(command)
-        
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
-        exit_status = stdout.channel.recv_exit_status()
+        with get_ssh_pool().connection(server) as ssh:
+            if sudo_password:
+                # Use shlex.quote to properly escape the password for the shell
+                quoted_password = shlex.quote(sudo_password)
+                full_command = f"echo {quoted_password} | sudo -S {command}"
+                stdin, stdout, stderr = ssh.exec_command(full_command, get_pty=True)
+            else:
+                stdin, stdout, stderr = ssh.exec_command(command)
+
+            output = stdout.read().decode().strip()
+            error = stderr.read().decode().strip()
+            exit_status = stdout.channel.recv_exit_status()
 
         if exit_status != 0:
             logger.error(f"SSH command failed on {server.name} ({server.ip_address}): {command}\nError: {error}")
             raise HTTPException(status_code=500, detail=f"SSH command failed: {error}")
-        
+
         return output, error
+    except HTTPException:
+        raise
     except paramiko.AuthenticationException:
         raise HTTPException(status_code=401, detail="SSH authentication failed. Check username/password.")
     except paramiko.SSHException as e:
         raise HTTPException(status_code=500, detail=f"SSH connection error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred during SSH: {str(e)}")
-    finally:
-        ssh.close()
 
 # Helper to get server details from DB
 def get_server_from_db(server_id: int):
@@ -228,45 +665,62 @@ def get_server_from_db(server_id: int):
 
 # === USER AND GROUP MANAGEMENT ENDPOINTS (SSH-BASED) ===
 
-@app.get("/servers/{server_id}/users/", response_model=List[UserResponse])
+# Groups whose members are reported as administrators
+ADMIN_GROUPS = {"sudo", "admin"}
+
+def _parse_getent_passwd(output: str) -> Dict[str, Dict]:
+    users: Dict[str, Dict] = {}
+    for line in output.splitlines():
+        parts = line.split(':')
+        if len(parts) >= 6:
+            try:
+                users[parts[0]] = {"uid": int(parts[2]), "gid": int(parts[3])}
+            except ValueError:
+                logger.warning(f"Unexpected 'getent passwd' line: {line}")
+    return users
+
+def _parse_getent_group(output: str) -> Dict[str, Dict]:
+    groups: Dict[str, Dict] = {}
+    for line in output.splitlines():
+        parts = line.split(':')
+        if len(parts) >= 3:
+            try:
+                gid = int(parts[2])
+            except ValueError:
+                logger.warning(f"Unexpected 'getent group' line: {line}")
+                continue
+            members = parts[3].split(',') if len(parts) > 3 and parts[3] else []
+            groups[parts[0]] = {"gid": gid, "members": members}
+    return groups
+
+@router.get("/servers/{server_id}/users/", response_model=List[UserResponse])
 async def list_users(server_id: int):
     server = get_server_from_db(server_id)
     
     users_output, _ = await _execute_ssh_command(server, "getent passwd")
     users_temp_data: Dict[str, Dict] = {}
-    for line in users_output.splitlines():
-        parts = line.split(':')
-        if len(parts) >= 6:
-            username = parts[0]
-            uid = int(parts[2])
-            users_temp_data[username] = {"id": uid, "username": username, "is_admin": False, "roles": [], "group_ids": []}
+    for username, passwd_entry in _parse_getent_passwd(users_output).items():
+        users_temp_data[username] = {"id": passwd_entry["uid"], "username": username, "is_admin": False, "roles": [], "group_ids": []}
 
     groups_output, _ = await _execute_ssh_command(server, "getent group")
-    group_name_to_gid: Dict[str, int] = {}
-    for line in groups_output.splitlines():
-        parts = line.split(':')
-        if len(parts) >= 3:
-            group_name = parts[0]
-            gid = int(parts[2])
-            group_name_to_gid[group_name] = gid
-            members = parts[3].split(',') if parts[3] else []
-            
-            if group_name == "sudo" or group_name == "admin":
-                for member in members:
-                    if member in users_temp_data:
-                        users_temp_data[member]["is_admin"] = True
-            
-            for member in members:
-                if member in users_temp_data:
-                    if group_name not in users_temp_data[member]["roles"]:
-                        users_temp_data[member]["roles"].append(group_name)
-                    if gid not in users_temp_data[member]["group_ids"]:
-                        users_temp_data[member]["group_ids"].append(gid)
+    for group_name, group_entry in _parse_getent_group(groups_output).items():
+        gid = group_entry["gid"]
+        for member in group_entry["members"]:
+            if member in users_temp_data:
+                if group_name in ADMIN_GROUPS:
+                    users_temp_data[member]["is_admin"] = True
+                if group_name not in users_temp_data[member]["roles"]:
+                    users_temp_data[member]["roles"].append(group_name)
+                if gid not in users_temp_data[member]["group_ids"]:
+                    users_temp_data[member]["group_ids"].append(gid)
+
+    # Keep the fleet-wide identity index in sync with what we just read
+    _index_identities_safely(server, users_output, groups_output)
     
     # Convert the temporary dictionary data into a list of UserResponse Pydantic models
     return [UserResponse(**data) for data in users_temp_data.values()]
 
-@app.post("/servers/{server_id}/users/", response_model=UserResponse, status_code=201)
+@router.post("/servers/{server_id}/users/", response_model=UserResponse, status_code=201)
 async def create_user(server_id: int, user: UserCreate):
     server = get_server_from_db(server_id)
 
@@ -302,7 +756,7 @@ async def create_user(server_id: int, user: UserCreate):
         raise HTTPException(status_code=500, detail="Failed to retrieve newly created user.")
     return newly_created_user
 
-@app.put("/servers/{server_id}/users/{username}", response_model=UserResponse)
+@router.put("/servers/{server_id}/users/{username}", response_model=UserResponse)
 async def update_user(server_id: int, username: str, user_update: UserUpdate):
     server = get_server_from_db(server_id)
 
@@ -368,7 +822,7 @@ async def update_user(server_id: int, username: str, user_update: UserUpdate):
         raise HTTPException(status_code=500, detail="Failed to retrieve updated user.")
     return updated_user_obj
 
-@app.delete("/servers/{server_id}/users/{username}", status_code=204)
+@router.delete("/servers/{server_id}/users/{username}", status_code=204)
 async def delete_user(server_id: int, username: str):
     server = get_server_from_db(server_id)
 
@@ -378,9 +832,10 @@ async def delete_user(server_id: int, username: str):
 
     delete_cmd = f"userdel -r {username}"
     await _execute_ssh_command(server, delete_cmd, server.ssh_password)
+    _drop_identity_entries(server_id, username=username)
     return
 
-@app.get("/servers/{server_id}/groups/", response_model=List[GroupResponse])
+@router.get("/servers/{server_id}/groups/", response_model=List[GroupResponse])
 async def list_groups(server_id: int):
     server = get_server_from_db(server_id)
     groups_output, _ = await _execute_ssh_command(server, "getent group")
@@ -394,7 +849,7 @@ async def list_groups(server_id: int):
             groups_data.append(GroupResponse(id=gid, name=group_name))
     return groups_data
 
-@app.post("/servers/{server_id}/groups/", response_model=GroupResponse, status_code=201)
+@router.post("/servers/{server_id}/groups/", response_model=GroupResponse, status_code=201)
 async def create_group(server_id: int, group: GroupCreate):
     server = get_server_from_db(server_id)
 
@@ -416,7 +871,7 @@ async def create_group(server_id: int, group: GroupCreate):
         raise HTTPException(status_code=500, detail="Failed to retrieve newly created group.")
     return newly_created_group
 
-@app.put("/servers/{server_id}/groups/{group_name}", response_model=GroupResponse)
+@router.put("/servers/{server_id}/groups/{group_name}", response_model=GroupResponse)
 async def update_group(server_id: int, group_name: str, group_update: GroupUpdate):
     server = get_server_from_db(server_id)
 
@@ -450,7 +905,7 @@ async def update_group(server_id: int, group_name: str, group_update: GroupUpdat
         raise HTTPException(status_code=500, detail="Failed to retrieve updated group.")
     return updated_group_obj
 
-@app.delete("/servers/{server_id}/groups/{group_name}", status_code=204)
+@router.delete("/servers/{server_id}/groups/{group_name}", status_code=204)
 async def delete_group(server_id: int, group_name: str):
     server = get_server_from_db(server_id)
 
@@ -460,17 +915,459 @@ async def delete_group(server_id: int, group_name: str):
 
     delete_cmd = f"groupdel {group_name}"
     await _execute_ssh_command(server, delete_cmd, server.ssh_password)
+    _drop_identity_entries(server_id, group_name=group_name)
     return
 
-@app.get("/servers/", response_model=List[ServerResponse])
-@app.get("/servers", response_model=List[ServerResponse]) # Allow requests without trailing slash
+# === IDENTITY INDEX (FLEET-WIDE USERS/GROUPS) ===
+
+IDENTITY_REFRESH_INTERVAL = int(os.environ.get("IDENTITY_REFRESH_INTERVAL", "300")) # Sekunden
+IDENTITY_SNAPSHOT_SEPARATOR = "--- getent group ---"
+NOBODY_ID = 65534 # nobody/nogroup are expected to share IDs everywhere
+
+def _fetch_identity_snapshot(server: Server):
+    """
+    Liest 'getent passwd' und 'getent group' in einer einzigen SSH-Sitzung (blockierend).
+    """
+    with get_ssh_pool().connection(server) as ssh:
+        stdin, stdout, stderr = ssh.exec_command(f"getent passwd; echo '{IDENTITY_SNAPSHOT_SEPARATOR}'; getent group")
+        output = stdout.read().decode()
+        exit_status = stdout.channel.recv_exit_status()
+        error = stderr.read().decode().strip()
+    if exit_status != 0 or IDENTITY_SNAPSHOT_SEPARATOR not in output:
+        raise RuntimeError(f"getent failed with status {exit_status}: {error}")
+    passwd_output, _, group_output = output.partition(IDENTITY_SNAPSHOT_SEPARATOR)
+    return passwd_output.strip(), group_output.strip()
+
+def _update_identity_index(db, server: Server, passwd_output: str, group_output: str) -> bool:
+    """
+    Gleicht den Index eines Servers mit einem getent-Snapshot ab. Unveränderte Snapshots
+    (gleicher Digest) kosten nur ein SELECT, sonst werden nur geänderte Zeilen geschrieben.
+    Gibt True zurück, wenn sich etwas geändert hat.
+    """
+    now = datetime.utcnow()
+    digest = hashlib.sha256(f"{passwd_output}\0{group_output}".encode()).hexdigest()
+    snapshot = db.query(IdentitySnapshot).filter(IdentitySnapshot.server_id == server.id).first()
+    if snapshot and snapshot.digest == digest:
+        snapshot.refreshed_at = now
+        db.commit()
+        return False
+
+    passwd_entries = _parse_getent_passwd(passwd_output)
+    group_entries = _parse_getent_group(group_output)
+
+    memberships: Dict[str, List[str]] = {username: [] for username in passwd_entries}
+    for group_name, group_entry in group_entries.items():
+        for member in group_entry["members"]:
+            if member in memberships:
+                memberships[member].append(group_name)
+
+    existing_users = {u.username: u for u in db.query(IdentityUser).filter(IdentityUser.server_id == server.id)}
+    for username, passwd_entry in passwd_entries.items():
+        groups = sorted(memberships[username])
+        values = {
+            "uid": passwd_entry["uid"],
+            "gid": passwd_entry["gid"],
+            "is_admin": any(g in ADMIN_GROUPS for g in groups),
+            "groups": ",".join(groups),
+        }
+        row = existing_users.pop(username, None)
+        if row is None:
+            db.add(IdentityUser(server_id=server.id, username=username, updated_at=now, **values))
+        elif any(getattr(row, key) != value for key, value in values.items()):
+            for key, value in values.items():
+                setattr(row, key, value)
+            row.updated_at = now
+    for row in existing_users.values():
+        db.delete(row)
+
+    existing_groups = {g.name: g for g in db.query(IdentityGroup).filter(IdentityGroup.server_id == server.id)}
+    for group_name, group_entry in group_entries.items():
+        values = {"gid": group_entry["gid"], "members": ",".join(sorted(group_entry["members"]))}
+        row = existing_groups.pop(group_name, None)
+        if row is None:
+            db.add(IdentityGroup(server_id=server.id, name=group_name, updated_at=now, **values))
+        elif any(getattr(row, key) != value for key, value in values.items()):
+            for key, value in values.items():
+                setattr(row, key, value)
+            row.updated_at = now
+    for row in existing_groups.values():
+        db.delete(row)
+
+    if snapshot is None:
+        db.add(IdentitySnapshot(server_id=server.id, digest=digest, refreshed_at=now, changed_at=now))
+    else:
+        snapshot.digest = digest
+        snapshot.refreshed_at = now
+        snapshot.changed_at = now
+    db.commit()
+    return True
+
+def _index_identities_safely(server: Server, passwd_output: str, group_output: str):
+    # The index is a cache; failing to update it must never break the calling endpoint
+    db = SessionLocal()
+    try:
+        _update_identity_index(db, server, passwd_output, group_output)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"[IDENTITY] Index-Update für {server.name} fehlgeschlagen: {e}")
+    finally:
+        db.close()
+
+def _drop_identity_entries(server_id: int, username: Optional[str] = None, group_name: Optional[str] = None):
+    db = SessionLocal()
+    try:
+        if username is not None:
+            db.query(IdentityUser).filter(IdentityUser.server_id == server_id, IdentityUser.username == username).delete()
+        if group_name is not None:
+            db.query(IdentityGroup).filter(IdentityGroup.server_id == server_id, IdentityGroup.name == group_name).delete()
+        # Force a full re-index on the next refresh
+        db.query(IdentitySnapshot).filter(IdentitySnapshot.server_id == server_id).delete()
+        db.commit()
+    finally:
+        db.close()
+
+def refresh_identity_index(server: Server) -> bool:
+    passwd_output, group_output = _fetch_identity_snapshot(server)
+    db = SessionLocal()
+    try:
+        return _update_identity_index(db, server, passwd_output, group_output)
+    finally:
+        db.close()
+
+async def _refresh_identity_index_for_all_servers():
+    db = SessionLocal()
+    servers = db.query(Server).all()
+    db.close()
+
+    async def refresh(server: Server):
+        async with get_ssh_session_slots():
+            try:
+                changed = await run_in_threadpool(refresh_identity_index, server)
+                if changed:
+                    logger.info(f"[IDENTITY] Index für {server.name} aktualisiert.")
+            except Exception as e:
+                logger.warning(f"[IDENTITY] Fehler beim Einlesen der Identitäten von {server.name} ({server.ip_address}): {e}")
+
+    await asyncio.gather(*(refresh(server) for server in servers))
+
+@router.get("/identities/users/{username}", response_model=IdentityUserResponse)
+async def get_identity_user(username: str):
+    """
+    Zeigt, auf welchen Servern ein User existiert (UID, Gruppen, Admin-Status) – aus dem Index.
+    """
+    db = SessionLocal()
+    rows = (
+        db.query(IdentityUser, Server.name)
+        .join(Server, Server.id == IdentityUser.server_id)
+        .filter(IdentityUser.username == username)
+        .order_by(Server.name)
+        .all()
+    )
+    uids = {row.uid for row, _ in rows}
+    shared_with = [
+        name for (name,) in db.query(IdentityUser.username)
+        .filter(IdentityUser.uid.in_(uids), IdentityUser.username != username)
+        .distinct()
+    ] if uids else []
+    db.close()
+    if not rows:
+        raise HTTPException(status_code=404, detail="User not found on any server.")
+
+    return IdentityUserResponse(
+        username=username,
+        uid_collision=len(uids) > 1,
+        uid_shared_with=sorted(shared_with),
+        servers=[
+            IdentityUserEntry(
+                server_id=row.server_id,
+                server_name=server_name,
+                uid=row.uid,
+                gid=row.gid,
+                is_admin=row.is_admin,
+                groups=row.groups.split(',') if row.groups else [],
+            )
+            for row, server_name in rows
+        ],
+    )
+
+@router.get("/identities/groups/{group_name}", response_model=IdentityGroupResponse)
+async def get_identity_group(group_name: str):
+    """
+    Zeigt, auf welchen Servern eine Gruppe existiert (GID, Mitglieder) – aus dem Index.
+    """
+    db = SessionLocal()
+    rows = (
+        db.query(IdentityGroup, Server.name)
+        .join(Server, Server.id == IdentityGroup.server_id)
+        .filter(IdentityGroup.name == group_name)
+        .order_by(Server.name)
+        .all()
+    )
+    gids = {row.gid for row, _ in rows}
+    shared_with = [
+        name for (name,) in db.query(IdentityGroup.name)
+        .filter(IdentityGroup.gid.in_(gids), IdentityGroup.name != group_name)
+        .distinct()
+    ] if gids else []
+    db.close()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Group not found on any server.")
+
+    return IdentityGroupResponse(
+        name=group_name,
+        gid_collision=len(gids) > 1,
+        gid_shared_with=sorted(shared_with),
+        servers=[
+            IdentityGroupEntry(
+                server_id=row.server_id,
+                server_name=server_name,
+                gid=row.gid,
+                members=row.members.split(',') if row.members else [],
+            )
+            for row, server_name in rows
+        ],
+    )
+
+def _find_identity_collisions(db, model, name_col, id_col, label: str, min_id: int) -> List[IdentityCollision]:
+    scoped = db.query(model).filter(id_col >= min_id, id_col != NOBODY_ID)
+    mismatched_names = [
+        name for (name,) in scoped.with_entities(name_col)
+        .group_by(name_col).having(func.count(func.distinct(id_col)) > 1)
+    ]
+    conflicting_ids = [
+        id_value for (id_value,) in scoped.with_entities(id_col)
+        .group_by(id_col).having(func.count(func.distinct(name_col)) > 1)
+    ]
+    if not mismatched_names and not conflicting_ids:
+        return []
+
+    rows = (
+        db.query(model.server_id, Server.name, name_col, id_col)
+        .join(Server, Server.id == model.server_id)
+        .filter((name_col.in_(mismatched_names)) | (id_col.in_(conflicting_ids)))
+        .filter(id_col >= min_id, id_col != NOBODY_ID)
+        .order_by(Server.name)
+        .all()
+    )
+    by_name: Dict[str, List[IdentityAssignment]] = {}
+    by_id: Dict[int, List[IdentityAssignment]] = {}
+    for server_id, server_name, name, id_value in rows:
+        assignment = IdentityAssignment(server_id=server_id, server_name=server_name, name=name, id=id_value)
+        by_name.setdefault(name, []).append(assignment)
+        by_id.setdefault(id_value, []).append(assignment)
+
+    collisions = [
+        IdentityCollision(kind=f"{label}_mismatch", subject=name, assignments=by_name[name])
+        for name in sorted(mismatched_names)
+    ]
+    collisions += [
+        IdentityCollision(kind=f"{label}_conflict", subject=str(id_value), assignments=by_id[id_value])
+        for id_value in sorted(conflicting_ids)
+    ]
+    return collisions
+
+@router.get("/identities/collisions", response_model=List[IdentityCollision])
+async def list_identity_collisions(min_id: int = 1000):
+    """
+    Findet UID/GID-Kollisionen über alle Server: gleicher Name mit unterschiedlicher ID
+    (*_mismatch) und gleiche ID mit unterschiedlichen Namen (*_conflict).
+    System-IDs unterhalb von min_id werden ignoriert.
+    """
+    db = SessionLocal()
+    try:
+        collisions = _find_identity_collisions(db, IdentityUser, IdentityUser.username, IdentityUser.uid, "uid", min_id)
+        collisions += _find_identity_collisions(db, IdentityGroup, IdentityGroup.name, IdentityGroup.gid, "gid", min_id)
+    finally:
+        db.close()
+    return collisions
+
+# === DECLARATIVE USER/GROUP RECONCILIATION ===
+
+FIRST_REGULAR_ID = 1000
+VALID_ACCOUNT_NAME = re.compile(r"^[a-z_][a-z0-9_.-]*\$?$", re.IGNORECASE)
+CREDENTIALS_MARKER = "--credentials--" # Trennt das sudo-Passwort von den chpasswd-Zeilen auf stdin
+
+def _find_id_conflicts(kind: str, wanted: List[Tuple[str, Optional[int]]], owners: Dict[int, str]) -> List[str]:
+    """Gewünschte IDs, die auf dem Host (oder im Soll-Zustand) schon jemand anderem gehören."""
+    conflicts = []
+    claimed: Dict[int, str] = {}
+    for name, wanted_id in wanted:
+        if wanted_id is None:
+            continue
+        owner = owners.get(wanted_id) or claimed.get(wanted_id)
+        if owner is not None and owner != name:
+            conflicts.append(f"{kind} {wanted_id} for {name} is already used by {owner}")
+        claimed.setdefault(wanted_id, name)
+    return conflicts
+
+def _plan_reconciliation(desired: ReconcileRequest, passwd_entries: Dict[str, Dict], group_entries: Dict[str, Dict]):
+    """
+    Berechnet lokal die minimale Menge an Befehlen, um den Soll-Zustand herzustellen.
+    Gibt (Liste von (ReconcileChange, auszuführender Befehl), chpasswd-Zeilen) zurück;
+    die Passwörter stehen nur in den chpasswd-Zeilen, nie in den Befehlen.
+    """
+    user_names = [u.username for u in desired.users]
+    group_names = [g.name for g in desired.groups]
+    for name in user_names + group_names + [gn for u in desired.users for gn in (u.group_names or [])]:
+        if not VALID_ACCOUNT_NAME.match(name):
+            raise HTTPException(status_code=400, detail=f"Invalid user or group name: {name}")
+    if len(set(user_names)) != len(user_names) or len(set(group_names)) != len(group_names):
+        raise HTTPException(status_code=400, detail="Duplicate users or groups in desired state.")
+    for user in desired.users:
+        # chpasswd liest zeilenweise: ein Zeilenumbruch würde die Zeilen der folgenden User verschieben
+        if user.password is not None and ("\n" in user.password or "\r" in user.password):
+            raise HTTPException(status_code=400, detail=f"Password for user {user.username} must not contain line breaks.")
+
+    known_groups = set(group_entries) | set(group_names)
+    for user in desired.users:
+        missing = [gn for gn in (user.group_names or []) if gn not in known_groups]
+        if user.is_admin and "sudo" not in known_groups:
+            missing.append("sudo")
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Groups for user {user.username} do not exist: {', '.join(missing)}")
+
+    # ID-Kollisionen würden das Batch mitten drin abbrechen (set -e), daher vorher ablehnen
+    conflicts = _find_id_conflicts("GID", [(g.name, g.gid) for g in desired.groups],
+                                   {e["gid"]: name for name, e in group_entries.items()})
+    conflicts += _find_id_conflicts("UID", [(u.username, u.uid) for u in desired.users],
+                                    {e["uid"]: name for name, e in passwd_entries.items()})
+    if conflicts:
+        raise HTTPException(status_code=400, detail="; ".join(conflicts))
+
+    memberships: Dict[str, Set[str]] = {username: set() for username in passwd_entries}
+    for group_name, group_entry in group_entries.items():
+        for member in group_entry["members"]:
+            if member in memberships:
+                memberships[member].add(group_name)
+
+    plan = []
+    credentials: List[str] = []
+
+    def add(action: str, target: str, command: str):
+        plan.append((ReconcileChange(action=action, target=target, command=command), command))
+
+    # 1. Groups first, so that new users can be added to them
+    for group in desired.groups:
+        current = group_entries.get(group.name)
+        gid_arg = f"-g {group.gid} " if group.gid is not None else ""
+        if current is None:
+            add("create_group", group.name, f"groupadd {gid_arg}{shlex.quote(group.name)}")
+        elif group.gid is not None and group.gid != current["gid"]:
+            add("update_group", group.name, f"groupmod -g {group.gid} {shlex.quote(group.name)}")
+
+    # 2. Users and their memberships
+    for user in desired.users:
+        quoted_user = shlex.quote(user.username)
+        current_groups = memberships.get(user.username, set())
+        target_groups = set(user.group_names) if user.group_names is not None else set(current_groups)
+        if user.is_admin is None:
+            target_groups |= current_groups & ADMIN_GROUPS
+        elif user.is_admin:
+            if not target_groups & ADMIN_GROUPS:
+                target_groups.add("sudo")
+        else:
+            target_groups -= ADMIN_GROUPS
+
+        if user.username not in passwd_entries:
+            uid_arg = f"-u {user.uid} " if user.uid is not None else ""
+            groups_arg = f"-G {shlex.quote(','.join(sorted(target_groups)))} " if target_groups else ""
+            add("create_user", user.username, f"useradd -m {uid_arg}{groups_arg}{quoted_user}")
+            if user.password is not None:
+                credentials.append(f"{user.username}:{user.password}")
+                # printf ist ein Shell-Builtin: die Zeile taucht in keiner Prozessliste auf
+                add("set_password", user.username, f"printf '%s\\n' \"$credentials\" | sed -n {len(credentials)}p | chpasswd")
+            continue
+
+        if user.uid is not None and user.uid != passwd_entries[user.username]["uid"]:
+            add("update_user", user.username, f"usermod -u {user.uid} {quoted_user}")
+        to_add = sorted(target_groups - current_groups)
+        if to_add:
+            add("add_groups", user.username, f"usermod -aG {shlex.quote(','.join(to_add))} {quoted_user}")
+        for group_name in sorted(current_groups - target_groups):
+            add("remove_group", f"{user.username}:{group_name}", f"gpasswd -d {quoted_user} {shlex.quote(group_name)}")
+
+    # 3. Pruning last, only for regular (non-system) accounts
+    removed_users = set()
+    if desired.prune_users:
+        for username, passwd_entry in sorted(passwd_entries.items()):
+            uid = passwd_entry["uid"]
+            if username not in user_names and FIRST_REGULAR_ID <= uid != NOBODY_ID:
+                removed_users.add(username)
+                add("delete_user", username, f"userdel -r {shlex.quote(username)}")
+    if desired.prune_groups:
+        primary_gids = {e["gid"] for u, e in passwd_entries.items() if u not in removed_users}
+        for group_name, group_entry in sorted(group_entries.items()):
+            gid = group_entry["gid"]
+            if (group_name not in group_names and FIRST_REGULAR_ID <= gid != NOBODY_ID
+                    and gid not in primary_gids and group_name not in removed_users):
+                add("delete_group", group_name, f"groupdel {shlex.quote(group_name)}")
+
+    return plan, credentials
+
+def _run_reconcile_script(server: Server, script: str, credentials: List[str]):
+    """
+    Führt das Batch per sudo aus (blockierend). sudo-Passwort und chpasswd-Zeilen gehen über
+    stdin des Kanals, damit sie weder in Prozesslisten noch im Log landen.
+    """
+    with get_ssh_pool().connection(server) as ssh:
+        stdin, stdout, stderr = ssh.exec_command(f"sudo -S -p '' sh -c {shlex.quote(script)}")
+        # Ohne Passwortabfrage (root/NOPASSWD) bleibt die erste Zeile stehen, daher der Marker
+        stdin.write("".join(f"{line}\n" for line in [server.ssh_password, CREDENTIALS_MARKER, *credentials]))
+        stdin.flush()
+        stdin.channel.shutdown_write()
+        error = stderr.read().decode().strip()
+        exit_status = stdout.channel.recv_exit_status()
+    return exit_status, error
+
+@router.post("/servers/{server_id}/reconcile", response_model=ReconcileResult)
+async def reconcile_identities(server_id: int, desired: ReconcileRequest):
+    """
+    Gleicht User und Gruppen eines Servers mit einem Soll-Zustand ab: ein einziger
+    getent-Snapshot, lokaler Diff, und alle nötigen Befehle in einem sudo-Batch.
+    Mit dry_run wird nur der Plan zurückgegeben.
+    """
+    server = get_server_from_db(server_id)
+    try:
+        passwd_output, group_output = await run_in_threadpool(_fetch_identity_snapshot, server)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read users/groups: {str(e)}")
+    _index_identities_safely(server, passwd_output, group_output)
+
+    plan, credentials = _plan_reconciliation(desired, _parse_getent_passwd(passwd_output), _parse_getent_group(group_output))
+    changes = [change for change, _ in plan]
+    if not plan or desired.dry_run:
+        return ReconcileResult(server_id=server_id, dry_run=desired.dry_run, converged=not plan, applied=False, changes=changes)
+
+    commands = [command for _, command in plan]
+    if credentials:
+        commands.insert(0, f"credentials=$(awk 'seen {{ print }} $0 == \"{CREDENTIALS_MARKER}\" {{ seen = 1 }}')")
+    script = "set -e\n" + "\n".join(commands)
+    logger.info(f"[RECONCILE] Wende {len(plan)} Änderungen auf {server.name} an.")
+    try:
+        exit_status, error = await run_in_threadpool(_run_reconcile_script, server, script, credentials)
+    except paramiko.AuthenticationException:
+        raise HTTPException(status_code=401, detail="SSH authentication failed. Check username/password.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"SSH connection error: {str(e)}")
+    if exit_status != 0:
+        logger.error(f"[RECONCILE] Abgleich auf {server.name} fehlgeschlagen (Status {exit_status}): {error}")
+        raise HTTPException(status_code=500, detail=f"Reconciliation failed: {error}")
+
+    try:
+        await run_in_threadpool(refresh_identity_index, server)
+    except Exception as e:
+        logger.warning(f"[RECONCILE] Index-Aktualisierung nach Abgleich auf {server.name} fehlgeschlagen: {e}")
+    return ReconcileResult(server_id=server_id, dry_run=False, converged=False, applied=True, changes=changes)
+
+@router.get("/servers/", response_model=List[ServerResponse])
+@router.get("/servers", response_model=List[ServerResponse]) # Allow requests without trailing slash
 async def list_servers():
     db = SessionLocal()
     servers = db.query(Server).all()
     db.close()
     return servers
 
-@app.post("/servers/{server_id}/cockpit-link")
+@router.post("/servers/{server_id}/cockpit-link")
 async def get_cockpit_link(server_id: int):
     db = SessionLocal()
     server = db.query(Server).filter(Server.id == server_id).first()
@@ -484,8 +1381,41 @@ async def get_cockpit_link(server_id: int):
 # === ÜBERARBEITETE ENDPUNKTE ===
 
 
-@app.post("/servers/", response_model=ServerResponse)
-@app.post("/servers", response_model=ServerResponse, include_in_schema=False) 
+def _install_monitoring_software(ssh, server: ServerCreate, log_prefix: str = "[INSTALL]") -> bool:
+    """
+    Installiert Cockpit und Netdata über eine bestehende SSH-Verbindung.
+    Gibt True zurück, wenn beide Installationen erfolgreich waren.
+    """
+    # Schritt 1: Cockpit installieren (bleibt unverändert)
+    # Use shlex.quote for the password
+    quoted_ssh_password = shlex.quote(server.ssh_password)
+    cockpit_install_cmd = (
+        f"echo {quoted_ssh_password} | sudo -S apt-get update && "
+        f"echo {quoted_ssh_password} | sudo -S apt-get install -y cockpit && "
+        f"echo {quoted_ssh_password} | sudo -S systemctl enable --now cockpit.socket"
+    )
+    
+    logger.info(f"{log_prefix} Installiere Cockpit auf {server.ip_address}...")
+    stdin, stdout, stderr = ssh.exec_command(cockpit_install_cmd, get_pty=True)
+    # Warten auf Beendigung des Befehls
+    cockpit_status = stdout.channel.recv_exit_status()
+    logger.info(f"{log_prefix} Cockpit-Installation beendet mit Status {cockpit_status}.")
+    if cockpit_status != 0:
+        logger.error(f"Cockpit install stderr: {stderr.read().decode()}")
+
+    # Schritt 2: Netdata installieren (NEU)
+    netdata_install_cmd = "bash <(curl -Ss https://my-netdata.io/kickstart.sh) --non-interactive --dont-wait"
+    logger.info(f"{log_prefix} Installiere Netdata auf {server.ip_address}...")
+    stdin, stdout, stderr = ssh.exec_command(netdata_install_cmd, get_pty=True)
+    netdata_status = stdout.channel.recv_exit_status()
+    logger.info(f"{log_prefix} Netdata-Installation beendet mit Status {netdata_status}.")
+    if netdata_status != 0:
+        logger.error(f"Netdata install stderr: {stderr.read().decode()}")
+
+    return cockpit_status == 0 and netdata_status == 0
+
+@router.post("/servers/", response_model=ServerResponse)
+@router.post("/servers", response_model=ServerResponse, include_in_schema=False) 
 async def create_server(server: ServerCreate):
     """
     Legt einen neuen Server an, testet SSH und installiert Cockpit UND Netdata.
@@ -498,31 +1428,7 @@ async def create_server(server: ServerCreate):
         ssh.connect(server.ip_address, username=server.ssh_user, password=server.ssh_password, timeout=10)
         logger.info(f"[CREATE_SERVER] SSH-Verbindung zu {server.ip_address} erfolgreich.")
 
-        # Schritt 1: Cockpit installieren (bleibt unverändert)
-        # Use shlex.quote for the password
-        quoted_ssh_password = shlex.quote(server.ssh_password)
-        cockpit_install_cmd = (
-            f"echo {quoted_ssh_password} | sudo -S apt-get update && "
-            f"echo {quoted_ssh_password} | sudo -S apt-get install -y cockpit && "
-            f"echo {quoted_ssh_password} | sudo -S systemctl enable --now cockpit.socket"
-        )
-        
-        logger.info(f"[CREATE_SERVER] Installiere Cockpit auf {server.ip_address}...")
-        stdin, stdout, stderr = ssh.exec_command(cockpit_install_cmd, get_pty=True)
-        # Warten auf Beendigung des Befehls
-        exit_status = stdout.channel.recv_exit_status()
-        logger.info(f"[CREATE_SERVER] Cockpit-Installation beendet mit Status {exit_status}.")
-        if exit_status != 0:
-            logger.error(f"Cockpit install stderr: {stderr.read().decode()}")
-
-        # Schritt 2: Netdata installieren (NEU)
-        netdata_install_cmd = "bash <(curl -Ss https://my-netdata.io/kickstart.sh) --non-interactive --dont-wait"
-        logger.info(f"[CREATE_SERVER] Installiere Netdata auf {server.ip_address}...")
-        stdin, stdout, stderr = ssh.exec_command(netdata_install_cmd, get_pty=True)
-        exit_status = stdout.channel.recv_exit_status()
-        logger.info(f"[CREATE_SERVER] Netdata-Installation beendet mit Status {exit_status}.")
-        if exit_status != 0:
-            logger.error(f"Netdata install stderr: {stderr.read().decode()}")
+        _install_monitoring_software(ssh, server, log_prefix="[CREATE_SERVER]")
 
         ssh.close()
     except Exception as e:
@@ -543,7 +1449,142 @@ async def create_server(server: ServerCreate):
     db.close()
     return db_server
 
-@app.put("/servers/{server_id}", response_model=ServerResponse)
+IMPORT_CSV_COLUMNS = ["name", "ip_address", "ssh_user", "ssh_password"]
+
+def _parse_server_inventory(body: bytes, content_type: str) -> List[Dict]:
+    """
+    Liest ein Inventar als CSV (Header: name,ip_address,ssh_user,ssh_password) oder als JSON
+    (Liste von Servern bzw. {"servers": [...]}).
+    """
+    try:
+        text = body.decode("utf-8-sig")
+        if "csv" in content_type:
+            reader = csv.DictReader(io.StringIO(text))
+            missing = [column for column in IMPORT_CSV_COLUMNS if column not in (reader.fieldnames or [])]
+            if missing:
+                raise HTTPException(status_code=400, detail=f"CSV is missing columns: {', '.join(missing)}")
+            return [{key: (value or "").strip() for key, value in row.items() if key} for row in reader]
+        data = json.loads(text)
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse inventory: {str(e)}")
+    if isinstance(data, dict):
+        data = data.get("servers")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="Expected a list of servers or {\"servers\": [...]}.")
+    return [entry if isinstance(entry, dict) else {} for entry in data]
+
+def _validate_ssh_credentials(server: ServerCreate, install_software: bool) -> Optional[bool]:
+    """
+    Prüft den SSH-Login (blockierend) und installiert optional Cockpit/Netdata.
+    Gibt bei Installation deren Erfolg zurück, sonst None.
+    """
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        ssh.connect(server.ip_address, username=server.ssh_user, password=server.ssh_password, timeout=10)
+        if install_software:
+            return _install_monitoring_software(ssh, server, log_prefix="[IMPORT]")
+        return None
+    finally:
+        ssh.close()
+
+@router.post("/servers/import", response_model=ServerImportResult)
+async def import_servers(request: Request, install_software: bool = False, validate_ssh: bool = True):
+    """
+    Importiert viele Server auf einmal aus CSV (Content-Type text/csv) oder JSON.
+    SSH-Zugangsdaten werden parallel geprüft, Konflikte mit einer einzigen Abfrage erkannt
+    und alle gültigen Zeilen in einer Transaktion eingefügt. Liefert einen Bericht pro Zeile.
+    """
+    entries = _parse_server_inventory(await request.body(), request.headers.get("content-type", ""))
+
+    report: List[ServerImportRow] = []
+    candidates: List[Tuple[ServerImportRow, ServerCreate]] = []
+    seen_names: Set[str] = set()
+    seen_ips: Set[str] = set()
+    for index, entry in enumerate(entries, start=1):
+        # Der Bericht übernimmt die Rohwerte als Text, damit auch kaputte Zeilen (z.B. Listen) berichtet werden
+        name, ip_address = entry.get("name"), entry.get("ip_address")
+        row = ServerImportRow(row=index, name=None if name is None else str(name),
+                              ip_address=None if ip_address is None else str(ip_address), status="invalid")
+        report.append(row)
+        try:
+            server = ServerCreate(**entry)
+        except ValidationError as e:
+            row.detail = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            continue
+        if not server.name or not server.ip_address:
+            row.detail = "name and ip_address must not be empty"
+            continue
+        if server.name in seen_names or server.ip_address in seen_ips:
+            row.status = "duplicate"
+            row.detail = "Name or IP address appears earlier in the inventory."
+            continue
+        seen_names.add(server.name)
+        seen_ips.add(server.ip_address)
+        candidates.append((row, server))
+
+    # Conflicts with existing servers: one query for the whole inventory
+    db = SessionLocal()
+    existing = db.query(Server.name, Server.ip_address).filter(or_(
+        Server.name.in_([server.name for _, server in candidates]),
+        Server.ip_address.in_([server.ip_address for _, server in candidates]),
+    )).all() if candidates else []
+    db.close()
+    taken_names = {name for name, _ in existing}
+    taken_ips = {ip for _, ip in existing}
+    valid = []
+    for row, server in candidates:
+        if server.name in taken_names or server.ip_address in taken_ips:
+            row.status = "conflict"
+            row.detail = "A server with this name or IP address already exists."
+        else:
+            valid.append((row, server))
+
+    if validate_ssh or install_software:
+        async def check(row: ServerImportRow, server: ServerCreate) -> bool:
+            try:
+                async with get_ssh_session_slots():
+                    await run_in_threadpool(_validate_ssh_credentials, server, False)
+                if install_software:
+                    # Dauert Minuten pro Host: eigener Pool, damit Stats und Identitäten weiterlaufen
+                    async with install_session_slots.acquire():
+                        row.software_installed = await run_in_threadpool(_validate_ssh_credentials, server, True)
+                return True
+            except Exception as e:
+                row.status = "ssh_failed"
+                row.detail = str(e) or type(e).__name__
+                return False
+
+        results = await asyncio.gather(*(check(row, server) for row, server in valid))
+        valid = [entry for entry, ok in zip(valid, results) if ok]
+
+    if valid:
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            # Single multi-row INSERT, then one SELECT to map the new IDs back to the rows
+            db.execute(insert(Server).values([{**server.dict(), "created_at": now} for _, server in valid]))
+            ids = dict(db.query(Server.ip_address, Server.id).filter(
+                Server.ip_address.in_([server.ip_address for _, server in valid])
+            ).all())
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            for row, _ in valid:
+                row.status = "conflict"
+                row.detail = f"Insert failed, nothing was imported: {e.orig}"
+            valid = []
+        finally:
+            db.close()
+        for row, server in valid:
+            row.status = "created"
+            row.server_id = ids.get(server.ip_address)
+
+    created = sum(1 for row in report if row.status == "created")
+    logger.info(f"[IMPORT] {created} von {len(report)} Servern importiert.")
+    return ServerImportResult(created=created, failed=len(report) - created, rows=report)
+
+@router.put("/servers/{server_id}", response_model=ServerResponse)
 async def update_server(server_id: int, server: ServerUpdate):
     """
     Aktualisiert einen bestehenden Server in der Datenbank.
@@ -563,9 +1604,10 @@ async def update_server(server_id: int, server: ServerUpdate):
     db.commit()
     db.refresh(db_server)
     db.close()
+    _discard_pooled_connections(server_id) # Zugangsdaten können sich geändert haben
     return db_server
 
-@app.delete("/servers/{server_id}")
+@router.delete("/servers/{server_id}")
 async def delete_server(server_id: int):
     """
     Löscht einen Server aus der Datenbank.
@@ -576,22 +1618,953 @@ async def delete_server(server_id: int):
         db.close()
         raise HTTPException(status_code=404, detail="Server not found")
     
+    db.query(IdentityUser).filter(IdentityUser.server_id == server_id).delete()
+    db.query(IdentityGroup).filter(IdentityGroup.server_id == server_id).delete()
+    db.query(IdentitySnapshot).filter(IdentitySnapshot.server_id == server_id).delete()
+    db.query(StatsCacheEntry).filter(StatsCacheEntry.server_id == server_id).delete()
+    db.query(ServerInterest).filter(ServerInterest.server_id == server_id).delete()
+    db.query(ActiveAlert).filter(ActiveAlert.server_id == server_id).delete()
+    db.query(CollectorLease).filter(CollectorLease.name == _stats_claim_name(server_id)).delete()
     db.delete(db_server)
     db.commit()
     db.close()
+    _discard_pooled_connections(server_id)
     return {"message": "Server deleted successfully"}
 
-@app.get("/servers/{server_id}/stats", response_model=SystemStats)
-async def get_server_stats(server_id: int):
+# === FLEET COMMAND RUNNER (STREAMING) ===
+
+FLEET_QUEUE_SIZE = 64 # Gepufferte Events zwischen SSH-Threads und Client; begrenzt den Speicher
+FLEET_READ_CHUNK = 4096
+FLEET_IDLE_WAIT = 0.05
+FLEET_CANCEL_POLL = 1.0 # Sekunden zwischen Abfragen des Abbruch-Flags in fleet_runs
+# Startet den Befehl in einer eigenen Prozessgruppe und meldet deren ID als erste stdout-Zeile.
+# Ohne pty schickt sshd beim Schließen kein SIGHUP, daher wird die Gruppe bei Abbruch/Timeout explizit beendet.
+FLEET_GROUP_WRAPPER = 'echo $$; exec sh -c "$1"'
+
+class _FleetRunCancelled(Exception):
+    pass
+
+class _FleetHostTimeout(Exception):
+    pass
+
+def _stop_remote_group(ssh, server: Server, pgid: int, sudo: bool):
+    """Beendet die Prozessgruppe des Befehls (TERM, nach 2s KILL) über einen zweiten Kanal."""
+    script = (f"kill -TERM -{pgid} 2>/dev/null || exit 0; "
+              f"for i in 1 2 3 4 5 6 7 8 9 10; do sleep 0.2; kill -0 -{pgid} 2>/dev/null || exit 0; done; "
+              f"kill -KILL -{pgid} 2>/dev/null; exit 0")
+    try:
+        stdin, stdout, stderr = ssh.exec_command(f"sudo -S -p '' sh -c {shlex.quote(script)}" if sudo else script, timeout=10)
+        if sudo:
+            stdin.write(f"{server.ssh_password}\n")
+            stdin.flush()
+        stdin.channel.shutdown_write()
+        stdout.channel.recv_exit_status()
+    except Exception as e:
+        logger.warning(f"[FLEET] Konnte Prozessgruppe {pgid} auf {server.name} nicht beenden: {e}")
+
+def _stream_remote_command(server: Server, request: FleetCommandRequest, cancel: threading.Event, emit):
     """
-    Holt Systemstatistiken über die Netdata-API (CPU/RAM) und SSH (GPU/Users).
+    Führt einen Befehl auf einem Host aus und reicht die Ausgabe chunkweise über emit()
+    weiter (blockierend, läuft im Threadpool). Es wird nie mehr als ein Chunk gepuffert;
+    ab max_output_bytes wird die Ausgabe verworfen, der Befehl läuft aber bis zum Ende/Timeout.
+    Bei Abbruch oder Timeout wird der Befehl auf dem Host beendet.
     """
+    host = {"server_id": server.id, "host": server.name}
+    started = time.monotonic()
+    deadline = started + request.timeout
+    pgid: Optional[int] = None
+    finished = False
+
+    def stop():
+        nonlocal pgid
+        if pgid is not None and not finished:
+            _stop_remote_group(ssh, server, pgid, request.sudo)
+            pgid = None
+
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        ssh.connect(server.ip_address, username=server.ssh_user, password=server.ssh_password,
+                    timeout=min(10, request.timeout))
+        channel = ssh.get_transport().open_session()
+        command = f"setsid -w sh -c {shlex.quote(FLEET_GROUP_WRAPPER)} sh {shlex.quote(request.command)}"
+        if request.sudo:
+            # Password goes through the channel's stdin instead of the remote process list
+            channel.exec_command(f"sudo -S -p '' {command}")
+            channel.sendall(f"{server.ssh_password}\n".encode())
+        else:
+            channel.exec_command(command)
+        channel.shutdown_write()
+
+        forwarded = 0
+        header = b"" # stdout bis zur Zeile mit der Prozessgruppe
+        decoders = {name: codecs.getincrementaldecoder("utf-8")("replace") for name in ("stdout", "stderr")}
+        while True:
+            if cancel.is_set():
+                stop()
+                emit({"event": "cancelled", **host})
+                return
+            if time.monotonic() > deadline:
+                raise _FleetHostTimeout()
+
+            received = False
+            for stream, ready, recv in (("stdout", channel.recv_ready, channel.recv),
+                                        ("stderr", channel.recv_stderr_ready, channel.recv_stderr)):
+                if not ready():
+                    continue
+                data = recv(FLEET_READ_CHUNK)
+                received = True
+                if stream == "stdout" and header is not None:
+                    header += data
+                    if b"\n" not in header:
+                        continue
+                    first_line, _, data = header.partition(b"\n")
+                    pgid = int(first_line)
+                    header = None
+                if forwarded >= request.max_output_bytes or not data:
+                    continue # Drain and discard so the remote command can finish
+                chunk = data[:request.max_output_bytes - forwarded]
+                forwarded += len(chunk)
+                text = decoders[stream].decode(chunk)
+                if text:
+                    emit({"event": "output", **host, "stream": stream, "data": text}, deadline)
+                if forwarded >= request.max_output_bytes:
+                    emit({"event": "truncated", **host, "limit": request.max_output_bytes}, deadline)
+
+            if not received:
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    finished = True
+                    emit({"event": "exit", **host, "exit_status": channel.recv_exit_status(),
+                          "duration": round(time.monotonic() - started, 3)})
+                    return
+                time.sleep(FLEET_IDLE_WAIT)
+    except _FleetHostTimeout:
+        stop()
+        try:
+            emit({"event": "timeout", **host, "timeout": request.timeout})
+        except _FleetRunCancelled:
+            pass
+    except _FleetRunCancelled:
+        pass
+    except paramiko.AuthenticationException:
+        emit({"event": "error", **host, "detail": "SSH authentication failed. Check username/password."})
+    except Exception as e:
+        stop()
+        emit({"event": "error", **host, "detail": str(e)})
+    finally:
+        stop()
+        ssh.close()
+
+def _fleet_cancel_requested(run_id: str) -> bool:
     db = SessionLocal()
-    server = db.query(Server).filter(Server.id == server_id).first()
+    try:
+        run = db.query(FleetRun).filter(FleetRun.run_id == run_id).first()
+        return run is None or bool(run.cancel_requested)
+    finally:
+        db.close()
+
+def _finish_fleet_run(run_id: str):
+    db = SessionLocal()
+    try:
+        db.query(FleetRun).filter(FleetRun.run_id == run_id).delete()
+        db.commit()
+    finally:
+        db.close()
+
+async def _fleet_command_events(servers: List[Server], command_request: FleetCommandRequest,
+                                http_request: Request, run_id: str, cancel: threading.Event):
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=FLEET_QUEUE_SIZE)
+
+    def emit(event: Dict, deadline: Optional[float] = None):
+        # Called from SSH threads; blocks while the client is slow (backpressure),
+        # but never past the cancel flag or the host's deadline
+        future = asyncio.run_coroutine_threadsafe(queue.put(event), loop)
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                if cancel.is_set():
+                    future.cancel()
+                    raise _FleetRunCancelled()
+                if deadline is not None and time.monotonic() > deadline:
+                    future.cancel()
+                    raise _FleetHostTimeout()
+
+    async def run_host(server: Server):
+        async with fleet_session_slots.acquire():
+            if cancel.is_set():
+                try:
+                    # Nach einem Abbruch liest womöglich niemand mehr die Queue
+                    queue.put_nowait({"event": "cancelled", "server_id": server.id, "host": server.name})
+                except asyncio.QueueFull:
+                    pass
+                return
+            worker = asyncio.ensure_future(run_in_threadpool(_stream_remote_command, server, command_request, cancel, emit))
+            try:
+                await asyncio.shield(worker)
+            except asyncio.CancelledError:
+                # Slot erst freigeben, wenn der Thread den Remote-Befehl gestoppt hat
+                await worker
+                raise
+
+    def line(event: Dict) -> bytes:
+        return (orjson.dumps(event) if orjson is not None else json.dumps(event).encode()) + b"\n"
+
+    yield line({"event": "start", "run_id": run_id, "servers": [{"server_id": s.id, "host": s.name} for s in servers]})
+    hosts_done = asyncio.ensure_future(asyncio.gather(*(run_host(server) for server in servers), return_exceptions=True))
+    cancel_checked_at = time.monotonic()
+    try:
+        while True:
+            if not cancel.is_set() and time.monotonic() - cancel_checked_at >= FLEET_CANCEL_POLL:
+                cancel_checked_at = time.monotonic()
+                try:
+                    if await run_in_threadpool(_fleet_cancel_requested, run_id):
+                        logger.info(f"[FLEET] Lauf {run_id} wurde per DELETE abgebrochen.")
+                        cancel.set()
+                except Exception as e:
+                    logger.warning(f"[FLEET] Abbruch-Flag für {run_id} nicht lesbar: {e}")
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, hosts_done}, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield line(getter.result())
+                continue
+            getter.cancel()
+            if hosts_done.done():
+                while not queue.empty():
+                    yield line(queue.get_nowait())
+                break
+            if await http_request.is_disconnected():
+                logger.info(f"[FLEET] Client hat Lauf {run_id} abgebrochen.")
+                cancel.set()
+        yield line({"event": "done", "run_id": run_id, "cancelled": cancel.is_set()})
+    finally:
+        cancel.set()
+        hosts_done.cancel() # Hosts, die noch auf einen Slot warten, nicht mehr starten
+        await run_in_threadpool(_finish_fleet_run, run_id)
+
+@router.post("/commands/run")
+async def run_fleet_command(command_request: FleetCommandRequest, request: Request):
+    """
+    Führt einen Befehl parallel auf mehreren Servern aus und streamt die Ausgabe als NDJSON
+    (ein JSON-Objekt pro Zeile, mit server_id/host markiert). Pro Host gelten Byte-Limit und
+    Timeout; der Lauf endet bei Client-Abbruch oder DELETE /commands/{run_id} (von jedem Worker aus).
+    """
+    if not command_request.server_ids:
+        raise HTTPException(status_code=400, detail="No servers selected.")
+    if command_request.timeout <= 0 or command_request.max_output_bytes <= 0:
+        raise HTTPException(status_code=400, detail="timeout and max_output_bytes must be positive.")
+    db = SessionLocal()
+    servers = db.query(Server).filter(Server.id.in_(command_request.server_ids)).all()
     db.close()
-    if not server:
-        raise HTTPException(status_code=404, detail="Server not found")
+    missing = set(command_request.server_ids) - {server.id for server in servers}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Servers not found: {', '.join(map(str, sorted(missing)))}")
+
+    run_id = uuid.uuid4().hex
+    cancel = threading.Event()
+    db = SessionLocal()
+    db.add(FleetRun(run_id=run_id, started_at=datetime.utcnow()))
+    db.commit()
+    db.close()
+    logger.info(f"[FLEET] Lauf {run_id} auf {len(servers)} Servern: {command_request.command}")
+    return StreamingResponse(
+        _fleet_command_events(servers, command_request, request, run_id, cancel),
+        media_type="application/x-ndjson",
+    )
+
+@router.delete("/commands/{run_id}", status_code=204)
+async def cancel_fleet_command(run_id: str):
+    db = SessionLocal()
+    try:
+        updated = db.query(FleetRun).filter(FleetRun.run_id == run_id).update({"cancel_requested": True})
+        db.commit()
+    finally:
+        db.close()
+    if not updated:
+        raise HTTPException(status_code=404, detail="Run not found or already finished.")
+    return
+
+# === NETWORK DISCOVERY ===
+
+# Sekunden; bündelt /hosts und manuelle Discovery-Läufe, der periodische Lauf (DISCOVERY_INTERVAL)
+# lädt die Liste praktisch immer frisch
+FRITZ_HOSTS_TTL = float(os.environ.get("FRITZ_HOSTS_TTL", "60"))
+DISCOVERY_INTERVAL = float(os.environ.get("DISCOVERY_INTERVAL", "600"))
+DISCOVERY_REPROBE_INTERVAL = float(os.environ.get("DISCOVERY_REPROBE_INTERVAL", "3600")) # Unveränderte Hosts erst danach erneut proben
+DISCOVERY_CONCURRENCY = int(os.environ.get("DISCOVERY_CONCURRENCY", "64"))
+PROBE_TIMEOUT = float(os.environ.get("PROBE_TIMEOUT", "1.5"))
+PROBE_PORTS = {"ssh": 22, "cockpit": 9090, "netdata": 19999}
+
+_fritz_hosts_cache = {"hosts": None, "fetched_at": float("-inf")}
+_fritz_hosts_lock = threading.Lock()
+_discovery_lock: Optional[asyncio.Lock] = None # Erst im laufenden Event-Loop anlegen
+
+def _fetch_fritz_hosts() -> List[Dict]:
+    """
+    Lädt die Hostliste als ein einziges XML-Dokument (X_AVM-DE_GetHostListPath) statt wie
+    FritzHosts.get_hosts_info() mit einer SOAP-Abfrage pro Host.
+    """
+    from fritzconnection.core.processor import HostStorage
+    from fritzconnection.core.utils import get_xml_root
+    fc = get_fritz_connection()
+    path = fc.call_action("Hosts", "X_AVM-DE_GetHostListPath")["NewX_AVM-DE_HostListPath"]
+    # Nicht FritzHosts.get_hosts_attributes(): 1.12 übergibt dort nur den Pfad und die Session als Timeout
+    root = get_xml_root(f"{fc.address}:{fc.port}{path}", timeout=fc.timeout, session=fc.session)
+    return [
+        {
+            "ip": host.get("IPAddress"),
+            "name": host.get("HostName"),
+            "mac": host.get("MACAddress"),
+            "status": bool(host.get("Active")),
+            "interface_type": host.get("InterfaceType"),
+        }
+        for host in HostStorage(root).hosts_attributes
+    ]
+
+def _cached_fritz_hosts() -> List[Dict]:
+    """
+    Liefert die Hostliste der Fritz!Box (ip, name, mac, status), für FRITZ_HOSTS_TTL gecacht.
+    Gleichzeitige Aufrufe warten auf denselben Download.
+    """
+    with _fritz_hosts_lock:
+        now = time.monotonic()
+        if _fritz_hosts_cache["hosts"] is None or now - _fritz_hosts_cache["fetched_at"] > FRITZ_HOSTS_TTL:
+            _fritz_hosts_cache["hosts"] = _fetch_fritz_hosts()
+            _fritz_hosts_cache["fetched_at"] = now
+        return _fritz_hosts_cache["hosts"]
+
+async def _probe_port(ip_address: str, port: int, read_banner: bool = False):
+    """Gibt (offen, Banner) zurück. Das SSH-Banner ist die erste Zeile, die der Server sendet."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), timeout=PROBE_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False, None
+    banner = None
+    try:
+        if read_banner:
+            line = await asyncio.wait_for(reader.readline(), timeout=PROBE_TIMEOUT)
+            banner = line.decode(errors="replace").strip()[:255] or None
+    except (OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+    return True, banner
+
+async def _probe_host(ip_address: str, slots: asyncio.Semaphore) -> Dict:
+    async with slots:
+        (ssh_open, ssh_banner), (cockpit_open, _), (netdata_open, _) = await asyncio.gather(
+            _probe_port(ip_address, PROBE_PORTS["ssh"], read_banner=True),
+            _probe_port(ip_address, PROBE_PORTS["cockpit"]),
+            _probe_port(ip_address, PROBE_PORTS["netdata"]),
+        )
+    return {
+        "ssh_open": ssh_open,
+        "ssh_banner": ssh_banner,
+        "cockpit_open": cockpit_open,
+        "netdata_open": netdata_open,
+    }
+
+async def run_discovery(force: bool = False) -> DiscoveryRunResult:
+    """
+    Gleicht die Fritz!Box-Hostliste mit der Discovery-Tabelle ab. Nur neue, geänderte oder
+    lange nicht geprüfte Hosts werden (parallel, begrenzt) geprobt. Läufe in diesem Worker
+    werden serialisiert; während des Probings ist keine DB-Session offen.
+    """
+    global _discovery_lock
+    if _discovery_lock is None:
+        _discovery_lock = asyncio.Lock()
+    async with _discovery_lock:
+        fritz_hosts = await run_in_threadpool(_cached_fritz_hosts)
+        active_hosts = {h["ip"]: h for h in fritz_hosts if h.get("status") and h.get("ip")}
+
+        now = datetime.utcnow()
+        to_probe = await run_in_threadpool(_discovery_hosts_to_probe, active_hosts, force, now)
+        slots = asyncio.Semaphore(DISCOVERY_CONCURRENCY)
+        results = await asyncio.gather(*(_probe_host(ip_address, slots) for ip_address in to_probe))
+        candidates = await run_in_threadpool(_store_discovery, active_hosts, dict(zip(to_probe, results)), now)
+
+    logger.info(f"[DISCOVERY] {len(active_hosts)} aktive Hosts, {len(to_probe)} geprobt, {candidates} Kandidaten.")
+    return DiscoveryRunResult(hosts=len(active_hosts), probed=len(to_probe), candidates=candidates)
+
+def _discovery_hosts_to_probe(active_hosts: Dict[str, Dict], force: bool, now: datetime) -> List[str]:
+    reprobe_before = now - timedelta(seconds=DISCOVERY_REPROBE_INTERVAL)
+    db = SessionLocal()
+    try:
+        rows = {row.ip_address: row for row in db.query(DiscoveredHost).all()}
+    finally:
+        db.close()
+    to_probe = []
+    for ip_address, host in active_hosts.items():
+        row = rows.get(ip_address)
+        if (row is None or force or not row.active or row.mac != host.get("mac")
+                or row.last_probed is None or row.last_probed < reprobe_before):
+            to_probe.append(ip_address)
+    return to_probe
+
+def _store_discovery(active_hosts: Dict[str, Dict], results: Dict[str, Dict], now: datetime, attempts: int = 3) -> int:
+    """Schreibt Hostliste und Probe-Ergebnisse. Gibt die Zahl der SSH-Kandidaten zurück."""
+    for attempt in range(attempts):
+        db = SessionLocal()
+        try:
+            rows = {row.ip_address: row for row in db.query(DiscoveredHost).all()}
+            for ip_address, host in active_hosts.items():
+                row = rows.get(ip_address)
+                if row is None:
+                    row = DiscoveredHost(ip_address=ip_address, first_seen=now)
+                    db.add(row)
+                    rows[ip_address] = row
+                row.mac = host.get("mac")
+                row.hostname = host.get("name")
+                row.active = True
+                row.last_seen = now
+                if ip_address in results:
+                    for key, value in results[ip_address].items():
+                        setattr(row, key, value)
+                    row.last_probed = now
+            for ip_address, row in rows.items():
+                if ip_address not in active_hosts:
+                    row.active = False
+            db.commit()
+
+            registered_ips = {ip for (ip,) in db.query(Server.ip_address)}
+            return sum(1 for ip, row in rows.items() if _is_ssh_candidate(row) and ip not in registered_ips)
+        except IntegrityError:
+            # Ein anderer Worker hat denselben Host gerade angelegt; mit den neuen Zeilen erneut schreiben
+            db.rollback()
+            if attempt == attempts - 1:
+                raise
+        finally:
+            db.close()
+
+def _is_ssh_candidate(row: DiscoveredHost) -> bool:
+    # A real SSH server always greets with its banner; a bare open port is not enough
+    return bool(row.active and row.ssh_open and row.ssh_banner and row.ssh_banner.startswith("SSH-"))
+
+def _suggest_server_name(hostname: Optional[str], ip_address: str, taken: Set[str]) -> str:
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "-", hostname or "").strip("-") or f"host-{ip_address.replace('.', '-')}"
+    if name in taken:
+        name = f"{name}-{ip_address.split('.')[-1]}"
+    return name
+
+@router.post("/discovery/run", response_model=DiscoveryRunResult)
+async def trigger_discovery(force: bool = False):
+    """
+    Startet einen Discovery-Lauf über die (gecachte) Fritz!Box-Hostliste. Mit force=true
+    werden alle aktiven Hosts neu geprobt.
+    """
+    try:
+        return await run_discovery(force=force)
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=f"Fritz!Box is not configured: missing {e}")
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Another discovery run is writing the same hosts, try again.")
+
+@router.get("/discovery", response_model=List[DiscoveredHostResponse])
+async def list_discovered_hosts(candidates_only: bool = False, include_inactive: bool = False):
+    """
+    Listet die entdeckten Hosts. Nicht registrierte Hosts mit SSH-Banner enthalten
+    einen Vorschlag für einen neuen Server-Eintrag.
+    """
+    db = SessionLocal()
+    query = db.query(DiscoveredHost)
+    if not include_inactive:
+        query = query.filter(DiscoveredHost.active == True)
+    rows = query.order_by(DiscoveredHost.ip_address).all()
+    servers = db.query(Server.name, Server.ip_address).all()
+    db.close()
+
+    registered_ips = {ip for _, ip in servers}
+    taken_names = {name for name, _ in servers}
+    response = []
+    for row in rows:
+        registered = row.ip_address in registered_ips
+        suggestion = None
+        if _is_ssh_candidate(row) and not registered:
+            suggestion = ServerSuggestion(name=_suggest_server_name(row.hostname, row.ip_address, taken_names), ip_address=row.ip_address)
+            taken_names.add(suggestion.name)
+        elif candidates_only:
+            continue
+        response.append(DiscoveredHostResponse(
+            ip_address=row.ip_address,
+            mac=row.mac,
+            hostname=row.hostname,
+            active=row.active,
+            ssh_open=row.ssh_open,
+            ssh_banner=row.ssh_banner,
+            cockpit_open=row.cockpit_open,
+            netdata_open=row.netdata_open,
+            registered=registered,
+            suggested_server=suggestion,
+            first_seen=row.first_seen,
+            last_seen=row.last_seen,
+            last_probed=row.last_probed,
+        ))
+    return response
+
+# === SHARED CACHE & COLLECTOR LEADERSHIP ===
+
+COLLECTOR_ENABLED = os.environ.get("COLLECTOR_ENABLED", "1") == "1"
+MAX_SSH_SESSIONS = int(os.environ.get("MAX_SSH_SESSIONS", "8")) # Limit gleichzeitiger SSH-Sitzungen über alle Worker
+MAX_FLEET_SESSIONS = int(os.environ.get("MAX_FLEET_SESSIONS", "8")) # Eigenes Limit, damit lange Läufe die Stats nicht blockieren
+MAX_INSTALL_SESSIONS = int(os.environ.get("MAX_INSTALL_SESSIONS", "8")) # Software-Installation beim Import, ebenfalls getrennt
+SSH_SLOT_TTL = 60.0 # Sekunden; gehaltene Slots werden verlängert, verwaiste laufen ab
+SSH_SLOT_RETRY = 0.25 # Wartezeit zwischen Versuchen, wenn alle Slots belegt sind
+STATS_CLAIM_TTL = 30.0 # Sekunden; so lange gehört die erste Live-Abfrage eines Hosts einem Worker
+STATS_CLAIM_WAIT = 15.0 # So lange warten die anderen Worker auf dessen Ergebnis
+LEADER_LEASE_TTL = float(os.environ.get("LEADER_LEASE_TTL", "30"))
+LEADER_RENEW_INTERVAL = LEADER_LEASE_TTL / 3
+
+def _load_cached_stats(server_id: int) -> Optional[SystemStats]:
+    """Letzter gespeicherter Stand, unabhängig vom Alter (collected_at sagt, wie alt)."""
+    db = SessionLocal()
+    entry = db.query(StatsCacheEntry).filter(StatsCacheEntry.server_id == server_id).first()
+    db.close()
+    if entry is None:
+        return None
+    stats = SystemStats.parse_raw(entry.payload)
+    stats.collected_at = entry.collected_at
+    return stats
+
+def _store_stats(server_id: int, stats: SystemStats):
+    collected_at = stats.collected_at or datetime.utcnow()
+    payload = stats.json(exclude_none=True, exclude={"collected_at"})
+    db = SessionLocal()
+    try:
+        entry = db.query(StatsCacheEntry).filter(StatsCacheEntry.server_id == server_id).first()
+        if entry is None:
+            db.add(StatsCacheEntry(server_id=server_id, payload=payload, collected_at=collected_at))
+        else:
+            entry.payload = payload
+            entry.collected_at = collected_at
+        db.commit()
+    except IntegrityError:
+        # Another worker stored a fresh entry at the same time
+        db.rollback()
+    finally:
+        db.close()
+
+class CollectorLeadership:
+    """
+    Leader-Wahl über eine Lease-Zeile in der Datenbank. Der Leader verlängert die Lease
+    regelmäßig; stirbt er, übernimmt ein anderer Worker nach Ablauf der Lease.
+    Dient auch für kurzlebige Claims (z.B. die erste Live-Abfrage eines Hosts).
+    """
+
+    def __init__(self, name: str = "collector", ttl: float = LEADER_LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def try_acquire(self) -> bool:
+        """Übernimmt oder verlängert die Lease. Gibt True zurück, wenn diese Instanz Leader ist."""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        db = SessionLocal()
+        try:
+            # Atomic compare-and-set: only succeeds for the current holder or an expired lease
+            updated = (
+                db.query(CollectorLease)
+                .filter(CollectorLease.name == self.name)
+                .filter(or_(CollectorLease.holder == self.instance_id, CollectorLease.expires_at < now))
+                .update({"holder": self.instance_id, "expires_at": expires_at}, synchronize_session=False)
+            )
+            if not updated:
+                if db.query(CollectorLease).filter(CollectorLease.name == self.name).first() is not None:
+                    db.rollback()
+                    return False
+                db.add(CollectorLease(name=self.name, holder=self.instance_id, expires_at=expires_at))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def release(self):
+        db = SessionLocal()
+        try:
+            db.query(CollectorLease).filter(
+                CollectorLease.name == self.name, CollectorLease.holder == self.instance_id
+            ).update({"expires_at": datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+collector_leadership = CollectorLeadership()
+
+def _stats_claim_name(server_id: int) -> str:
+    return f"stats-poll:{server_id}"
+
+async def _collect_first_stats(server: Server) -> Optional[SystemStats]:
+    """
+    Für Hosts ohne jeden Cache-Eintrag: genau ein Worker (über eine Claim-Zeile) fragt live ab,
+    alle anderen warten auf dessen Ergebnis in der Datenbank. None, wenn nichts rechtzeitig kam.
+    """
+    claim = CollectorLeadership(name=_stats_claim_name(server.id), ttl=STATS_CLAIM_TTL)
+    if await run_in_threadpool(claim.try_acquire):
+        try:
+            async with get_ssh_session_slots():
+                stats = await run_in_threadpool(_collect_server_stats, server)
+            await run_in_threadpool(_store_stats, server.id, stats)
+            return stats
+        finally:
+            await run_in_threadpool(claim.release)
+
+    deadline = time.monotonic() + STATS_CLAIM_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.5)
+        stats = await run_in_threadpool(_load_cached_stats, server.id)
+        if stats is not None:
+            return stats
+    return None
+
+class SharedSessionSlots:
+    """
+    Begrenzt gleichzeitige SSH-Sitzungen über alle Worker: jeder Slot ist eine Lease-Zeile
+    ("<name>:<n>") in collector_leases. Ein lokales Semaphor sorgt dafür, dass pro Worker
+    höchstens so viele Anfragen auf einen freien Slot warten, wie es Slots gibt.
+    """
+
+    def __init__(self, name: str, size: int, ttl: float = SSH_SLOT_TTL):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self._local: Optional[asyncio.Semaphore] = None
+
+    def _try_claim(self) -> Optional[CollectorLeadership]:
+        slot_names = [f"{self.name}:{n}" for n in range(self.size)]
+        db = SessionLocal()
+        try:
+            busy = {name for (name,) in db.query(CollectorLease.name).filter(
+                CollectorLease.name.in_(slot_names), CollectorLease.expires_at >= datetime.utcnow())}
+        finally:
+            db.close()
+        free = [name for name in slot_names if name not in busy]
+        random.shuffle(free)
+        for name in free:
+            slot = CollectorLeadership(name=name, ttl=self.ttl)
+            if slot.try_acquire():
+                return slot
+        return None
+
+    async def _renew(self, slot: CollectorLeadership):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                if not await run_in_threadpool(slot.try_acquire):
+                    logger.warning(f"[SSH-SLOTS] Slot {slot.name} ist abgelaufen und wurde neu vergeben.")
+                    return
+            except Exception as e:
+                logger.warning(f"[SSH-SLOTS] Slot {slot.name} konnte nicht verlängert werden: {e}")
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._local is None:
+            # Created lazily so that the semaphore belongs to the running event loop
+            self._local = asyncio.Semaphore(self.size)
+        async with self._local:
+            while True:
+                slot = await run_in_threadpool(self._try_claim)
+                if slot is not None:
+                    break
+                await asyncio.sleep(SSH_SLOT_RETRY * random.uniform(0.5, 1.5))
+            renewal = asyncio.create_task(self._renew(slot))
+            try:
+                yield
+            finally:
+                renewal.cancel()
+                await run_in_threadpool(slot.release)
+
+ssh_session_slots = SharedSessionSlots("ssh-slot", MAX_SSH_SESSIONS)
+fleet_session_slots = SharedSessionSlots("fleet-slot", MAX_FLEET_SESSIONS) # Fleet-Läufe können lange dauern
+install_session_slots = SharedSessionSlots("install-slot", MAX_INSTALL_SESSIONS) # apt-get/Netdata dauern Minuten pro Host
+
+def get_ssh_session_slots():
+    return ssh_session_slots.acquire()
+
+# === ADAPTIVE POLL SCHEDULER ===
+
+MIN_POLL_INTERVAL = float(os.environ.get("MIN_POLL_INTERVAL", "5")) # Sekunden, für angesehene und volatile Hosts
+VIEWED_POLL_INTERVAL = float(os.environ.get("VIEWED_POLL_INTERVAL", "10")) # Obergrenze, solange jemand zuschaut
+MAX_POLL_INTERVAL = float(os.environ.get("MAX_POLL_INTERVAL", "120")) # Obergrenze für unbeobachtete, ruhige Hosts
+POLL_JITTER = float(os.environ.get("POLL_JITTER", "0.2")) # +/- Anteil des Intervalls
+VIEWER_TTL = float(os.environ.get("VIEWER_TTL", "30")) # So lange gilt ein Aufruf als aktiver Betrachter
+VOLATILITY_THRESHOLD = float(os.environ.get("VOLATILITY_THRESHOLD", "10")) # Prozentpunkte
+VIEW_RECORD_INTERVAL = 5.0 # Schreibt last_viewed_at höchstens alle 5s pro Server und Worker
+
+_last_view_recorded: Dict[int, float] = {}
+
+def _record_view(server_id: int):
+    now = time.monotonic()
+    if now - _last_view_recorded.get(server_id, -VIEW_RECORD_INTERVAL) < VIEW_RECORD_INTERVAL:
+        return
+    _last_view_recorded[server_id] = now
+    db = SessionLocal()
+    try:
+        interest = db.query(ServerInterest).filter(ServerInterest.server_id == server_id).first()
+        if interest is None:
+            db.add(ServerInterest(server_id=server_id, last_viewed_at=datetime.utcnow()))
+        else:
+            interest.last_viewed_at = datetime.utcnow()
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+    finally:
+        db.close()
+
+def _viewed_server_ids() -> Set[int]:
+    cutoff = datetime.utcnow() - timedelta(seconds=VIEWER_TTL)
+    db = SessionLocal()
+    try:
+        return {server_id for (server_id,) in db.query(ServerInterest.server_id).filter(ServerInterest.last_viewed_at >= cutoff)}
+    finally:
+        db.close()
 
+def _volatility_signature(stats: SystemStats) -> Dict[str, float]:
+    signature = {"cpu": stats.cpu_percent, "memory": stats.memory_percent}
+    for index, gpu in enumerate(stats.gpu_stats):
+        signature[f"gpu{index}.util"] = gpu.utilization_gpu
+        if gpu.memory_total:
+            signature[f"gpu{index}.memory"] = gpu.memory_used / gpu.memory_total * 100
+        if gpu.temperature_gpu is not None:
+            signature[f"gpu{index}.temp"] = gpu.temperature_gpu
+    for disk in stats.disk_partitions:
+        if disk.use_percent:
+            try:
+                signature[f"disk.{disk.name}"] = float(disk.use_percent.rstrip('%'))
+            except ValueError:
+                pass
+    return signature
+
+class _PollState:
+    def __init__(self, now: float):
+        self.interval = VIEWED_POLL_INTERVAL
+        self.next_due = now + random.uniform(0, MIN_POLL_INTERVAL) # Spread the first round
+        self.signature: Dict[str, float] = {}
+        self.in_flight = False
+
+class PollScheduler:
+    """
+    Adaptiver Scheduler für die Stats-Abfrage: schnell für angesehene oder volatile Hosts,
+    langsam für unbeobachtete, ruhige Hosts. Jitter verteilt die Abfragen zeitlich,
+    die gemeinsamen SSH-Slots begrenzen die gleichzeitigen Sitzungen über alle Worker.
+    """
+
+    TICK = 1.0
+    SERVER_LIST_REFRESH = 30.0
+
+    def __init__(self):
+        self.states: Dict[int, _PollState] = {}
+        self.servers: Dict[int, Server] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.alerts = AlertEngine()
+        self._servers_loaded_at = float("-inf")
+
+    def _reload_servers(self, now: float) -> Set[int]:
+        db = SessionLocal()
+        servers = db.query(Server).all()
+        db.close()
+        self.servers = {server.id: server for server in servers}
+        removed = {server_id for server_id in self.states if server_id not in self.servers}
+        for server_id in removed:
+            del self.states[server_id]
+        for server_id in self.servers:
+            self.states.setdefault(server_id, _PollState(now))
+        self._servers_loaded_at = now
+        return removed
+
+    def _reschedule(self, state: _PollState, viewed: bool, volatile: bool, failed: bool = False):
+        if failed:
+            # Back off from unreachable hosts regardless of viewers
+            state.interval = min(state.interval * 2, MAX_POLL_INTERVAL)
+        else:
+            ceiling = VIEWED_POLL_INTERVAL if viewed else MAX_POLL_INTERVAL
+            state.interval = state.interval / 2 if volatile else state.interval * 1.5
+            state.interval = min(max(state.interval, MIN_POLL_INTERVAL), ceiling)
+        state.next_due = time.monotonic() + state.interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    async def _poll(self, server: Server, state: _PollState, viewed: bool):
+        try:
+            async with get_ssh_session_slots():
+                stats = await run_in_threadpool(_collect_server_stats, server)
+            await run_in_threadpool(_store_stats, server.id, stats)
+            self.alerts.observe(server.id, stats)
+        except Exception as e:
+            logger.warning(f"[SCHEDULER] Fehler beim Abfragen der Stats von {server.name} ({server.ip_address}): {e}")
+            self._reschedule(state, viewed, volatile=False, failed=True)
+            return
+        finally:
+            state.in_flight = False
+
+        signature = _volatility_signature(stats)
+        volatile = any(
+            abs(value - state.signature[key]) >= VOLATILITY_THRESHOLD
+            for key, value in signature.items() if key in state.signature
+        )
+        state.signature = signature
+        self._reschedule(state, viewed, volatile)
+
+    async def run(self):
+        try:
+            await self._loop()
+        finally:
+            for task in self.tasks:
+                task.cancel()
+
+    async def _loop(self):
+        while True:
+            now = time.monotonic()
+            try:
+                if now - self._servers_loaded_at >= self.SERVER_LIST_REFRESH:
+                    for server_id in await run_in_threadpool(self._reload_servers, now):
+                        self.alerts.forget_server(server_id)
+                viewed_ids = await run_in_threadpool(_viewed_server_ids)
+            except Exception as e:
+                logger.error(f"[SCHEDULER] Datenbankfehler: {e}")
+                await asyncio.sleep(self.TICK)
+                continue
+
+            for server_id, state in self.states.items():
+                if state.in_flight:
+                    continue
+                viewed = server_id in viewed_ids
+                # A host that just gained a viewer should not wait out its long idle interval
+                if viewed and state.next_due - now > VIEWED_POLL_INTERVAL:
+                    state.next_due = now + random.uniform(0, MIN_POLL_INTERVAL * POLL_JITTER)
+                if state.next_due <= now:
+                    state.in_flight = True
+                    task = asyncio.create_task(self._poll(self.servers[server_id], state, viewed))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+
+            try:
+                await self.alerts.evaluate()
+            except Exception as e:
+                logger.error(f"[ALERTS] Auswertung fehlgeschlagen: {e}")
+            await asyncio.sleep(self.TICK)
+
+async def _run_periodically(name: str, interval: float, job):
+    while True:
+        try:
+            await job()
+        except Exception as e:
+            logger.error(f"[COLLECTOR] Job '{name}' fehlgeschlagen: {e}")
+        await asyncio.sleep(interval)
+
+def _collector_jobs():
+    jobs = {
+        "identities": lambda: _run_periodically("identities", IDENTITY_REFRESH_INTERVAL, _refresh_identity_index_for_all_servers),
+        "stats": PollScheduler().run,
+    }
+    if os.environ.get("FRITZ_IP"):
+        jobs["discovery"] = lambda: _run_periodically("discovery", DISCOVERY_INTERVAL, run_discovery)
+    return jobs
+
+async def _collector_loop():
+    """
+    Läuft in jedem Worker. Nur der Lease-Inhaber startet die Sammel-Jobs; alle anderen
+    Worker bedienen ausschließlich Lesezugriffe aus der Datenbank.
+    """
+    jobs: List[asyncio.Task] = []
+    try:
+        while True:
+            try:
+                is_leader = await run_in_threadpool(collector_leadership.try_acquire)
+            except Exception as e:
+                logger.warning(f"[COLLECTOR] Lease konnte nicht erneuert werden: {e}")
+                is_leader = False
+
+            if is_leader and not jobs:
+                logger.info(f"[COLLECTOR] {collector_leadership.instance_id} ist Leader, starte Sammel-Jobs.")
+                jobs = [asyncio.create_task(job()) for job in _collector_jobs().values()]
+            elif not is_leader and jobs:
+                logger.warning(f"[COLLECTOR] {collector_leadership.instance_id} hat die Leader-Rolle verloren.")
+                for task in jobs:
+                    task.cancel()
+                jobs = []
+            await asyncio.sleep(LEADER_RENEW_INTERVAL)
+    finally:
+        for task in jobs:
+            task.cancel()
+        if jobs:
+            await run_in_threadpool(collector_leadership.release)
+
+# === RESOURCE ACCOUNTING (PER USER / PROCESS) ===
+
+TOP_PROCESSES = int(os.environ.get("TOP_PROCESSES", "10"))
+
+# Läuft auf dem Host: zwei Stichproben von /proc/*/stat im Abstand von ACCOUNTING_SAMPLE_SECONDS
+# liefern die aktuelle CPU-Last je Prozess (utime+stime-Delta), ps steuert User und RSS bei.
+# awk summiert pro User (U-Zeilen) und gibt die Top-N Prozesse aus (P-Zeilen); GPU-Prozesse
+# kommen als G-Zeilen (pid, user, MiB) dazu. ps -o pcpu wäre der Mittelwert über die ganze
+# Laufzeit und würde lange laufende Jobs mit wechselnder Last falsch darstellen.
+# Das Fenster verlängert jede Abfrage (und damit die Belegung eines SSH-Slots) um genau diese Zeit;
+# bei 100 Ticks/s liefert 0.2s noch eine Auflösung von 5 Prozentpunkten pro Prozess.
+ACCOUNTING_SAMPLE_SECONDS = float(os.environ.get("ACCOUNTING_SAMPLE_SECONDS", "0.2"))
+RESOURCE_ACCOUNTING_CMD = (
+    "hz=$(getconf CLK_TCK 2>/dev/null || echo 100); "
+    f"{{ cat /proc/[0-9]*/stat; echo --; sleep {ACCOUNTING_SAMPLE_SECONDS}; cat /proc/[0-9]*/stat; echo --; "
+    "ps -eo user:32=,pid=,rss=,comm=; } 2>/dev/null | "
+    f"awk -v top={TOP_PROCESSES} -v hz=\"$hz\" -v iv={ACCOUNTING_SAMPLE_SECONDS} "
+    "'$0 == \"--\" { phase++; next } "
+    # comm kann Leerzeichen enthalten: die Felder ab state beginnen nach der letzten Klammer
+    "phase < 2 { pid = $1; sub(/.*\\) /, \"\"); split($0, f, \" \"); "
+    "if (phase == 0) t0[pid] = f[12] + f[13]; else t1[pid] = f[12] + f[13]; next } "
+    "{ cpu = ($2 in t1) ? (t1[$2] - t0[$2]) * 100 / (hz * iv) : 0; if (cpu < 0) cpu = 0; "
+    "c[$1] += cpu; rss[$1] += $3; n[$1]++; pcpu[NR] = cpu; pids[NR] = $2; users[NR] = $1; mems[NR] = $3; comms[NR] = $4 } "
+    "END { for (u in c) printf \"U %s %.1f %d %d\\n\", u, c[u], rss[u], n[u]; "
+    "for (i = 0; i < top; i++) { best = \"\"; for (k in pcpu) if (best == \"\" || pcpu[k] > pcpu[best]) best = k; "
+    "if (best == \"\") break; printf \"P %s %s %.1f %s %s\\n\", pids[best], users[best], pcpu[best], mems[best], comms[best]; "
+    "delete pcpu[best] } }'; "
+    "command -v nvidia-smi >/dev/null 2>&1 && "
+    "nvidia-smi --query-compute-apps=pid,used_memory --format=csv,noheader,nounits 2>/dev/null | "
+    "while IFS=', ' read -r pid mem; do echo \"G $pid $(ps -o user= -p \"$pid\" 2>/dev/null) $mem\"; done; "
+    "true"
+)
+
+def _parse_resource_accounting(output: str):
+    """Wertet die Ausgabe von RESOURCE_ACCOUNTING_CMD aus. Gibt (user_usage, top_processes) zurück."""
+    users: Dict[str, UserResourceUsage] = {}
+    processes: List[ProcessUsage] = []
+    gpu_by_pid: Dict[int, float] = {}
+    for line in output.splitlines():
+        parts = line.split()
+        try:
+            if parts[0] == "U" and len(parts) == 5:
+                users[parts[1]] = UserResourceUsage(
+                    username=parts[1],
+                    cpu_percent=float(parts[2]),
+                    rss_mb=round(int(parts[3]) / 1024, 1),
+                    process_count=int(parts[4]),
+                )
+            elif parts[0] == "P" and len(parts) >= 6:
+                processes.append(ProcessUsage(
+                    pid=int(parts[1]),
+                    username=parts[2],
+                    cpu_percent=float(parts[3]),
+                    rss_mb=round(int(parts[4]) / 1024, 1),
+                    command=" ".join(parts[5:]),
+                ))
+            elif parts[0] == "G" and len(parts) == 4:
+                pid, username, memory = int(parts[1]), parts[2], float(parts[3])
+                gpu_by_pid[pid] = gpu_by_pid.get(pid, 0) + memory
+                if username not in users:
+                    users[username] = UserResourceUsage(username=username, cpu_percent=0, rss_mb=0, process_count=0)
+                users[username].gpu_memory_mb += memory
+        except (IndexError, ValueError):
+            logger.warning(f"[STATS][SSH] Unerwartete Accounting-Zeile: {line}")
+    for process in processes:
+        process.gpu_memory_mb = gpu_by_pid.get(process.pid)
+    user_usage = sorted(users.values(), key=lambda u: (u.cpu_percent, u.gpu_memory_mb, u.rss_mb), reverse=True)
+    return user_usage, processes
+
+def _collect_server_stats(server: Server) -> SystemStats:
+    """
+    Holt Systemstatistiken über die Netdata-API (CPU/RAM) und SSH (GPU/Users/Disks).
+    Blockierend – wird vom Collector bzw. im Threadpool aufgerufen.
+    """
     # --- CPU und RAM über Netdata API (FINALER, ROBUSTER ANSATZ) ---
     cpu_percent = 0.0
     memory_percent = 0.0
@@ -603,7 +2576,7 @@ async def get_server_stats(server_id: int):
         cpu_params = {'chart': 'system.cpu', 'after': -1, 'points': 1, 'group': 'average', 'format': 'json'}
         
         logger.info(f"[STATS][NETDATA] Frage CPU-Nutzung ab (system.cpu)...")
-        cpu_resp = requests.get(netdata_url, params=cpu_params, timeout=5)
+        cpu_resp = get_netdata_session().get(netdata_url, params=cpu_params, timeout=5)
         cpu_resp.raise_for_status() # Löst bei 404/500 einen Fehler aus
         cpu_data = cpu_resp.json()
 
@@ -624,7 +2597,7 @@ async def get_server_stats(server_id: int):
         # --- RAM-Nutzung ---
         logger.info(f"[STATS][NETDATA] Frage Speichernutzung ab (system.ram)...")
         mem_params = {'chart': 'system.ram', 'after': -1, 'points': 1, 'group': 'average', 'format': 'json'}
-        mem_resp = requests.get(netdata_url, params=mem_params, timeout=5)
+        mem_resp = get_netdata_session().get(netdata_url, params=mem_params, timeout=5)
         mem_resp.raise_for_status()
         mem_data = mem_resp.json()
         logger.info(f"[STATS][NETDATA] Speichernutzung erfolgreich abgefragt.")
@@ -686,180 +2659,193 @@ async def get_server_stats(server_id: int):
     # --- GPU-Infos und User via SSH (unverändert) ---
     gpu_stats = []
     active_users = []
+    user_usage = []
+    top_processes = []
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(server.ip_address, username=server.ssh_user, password=server.ssh_password, timeout=10)
+        with get_ssh_pool().connection(server) as ssh:
         
-        # GPU
-        # Query basic GPU metrics that are generally supported
-        gpu_query_cmd = (
-            "nvidia-smi --query-gpu=name,utilization.gpu,memory.used,memory.total,"
-            "fan.speed,temperature.gpu,power.draw,power.limit,pci.bus_id "
-            "--format=csv,noheader,nounits"
-        )
-        stdin, stdout, stderr = ssh.exec_command(gpu_query_cmd)
-        gpu_output = stdout.read().decode().strip()
+            # GPU
+            # Query basic GPU metrics that are generally supported
+            gpu_query_cmd = (
+                "nvidia-smi --query-gpu=name,utilization.gpu,memory.used,memory.total,"
+                "fan.speed,temperature.gpu,power.draw,power.limit,pci.bus_id "
+                "--format=csv,noheader,nounits"
+            )
+            stdin, stdout, stderr = ssh.exec_command(gpu_query_cmd)
+            gpu_output = stdout.read().decode().strip()
         
-        for line in gpu_output.splitlines():
-            vals = [v.strip() for v in line.split(',')]
-            # Expected 9 values based on the simplified query
-            if len(vals) == 9:
-                try:
-                    gpu_stats.append(GpuStats(
-                        name=vals[0],
-                        utilization_gpu=float(vals[1]),
-                        memory_used=float(vals[2]),
-                        memory_total=float(vals[3]),
-                        fan_speed=float(vals[4]) if vals[4] != '[Not Supported]' else None,
-                        temperature_gpu=float(vals[5]),
-                        power_draw=float(vals[6]),
-                        power_limit=float(vals[7]),
-                        pci_bus_id=vals[8]
-                    ))
-                except ValueError as e:
-                    logger.error(f"Error parsing GPU stats line '{line}': {e}")
-            else:
-                logger.warning(f"Unexpected number of values in GPU stats line: '{line}' (Expected 9, got {len(vals)})")
+            for line in gpu_output.splitlines():
+                vals = [v.strip() for v in line.split(',')]
+                # Expected 9 values based on the simplified query
+                if len(vals) == 9:
+                    try:
+                        gpu_stats.append(GpuStats(
+                            name=vals[0],
+                            utilization_gpu=float(vals[1]),
+                            memory_used=float(vals[2]),
+                            memory_total=float(vals[3]),
+                            fan_speed=float(vals[4]) if vals[4] != '[Not Supported]' else None,
+                            temperature_gpu=float(vals[5]),
+                            power_draw=float(vals[6]),
+                            power_limit=float(vals[7]),
+                            pci_bus_id=vals[8]
+                        ))
+                    except ValueError as e:
+                        logger.error(f"Error parsing GPU stats line '{line}': {e}")
+                else:
+                    logger.warning(f"Unexpected number of values in GPU stats line: '{line}' (Expected 9, got {len(vals)})")
         
-        # User
-        # Modified command to get full 'w' output for more structured parsing
-        stdin, stdout, stderr = ssh.exec_command("w")
-        users_output = stdout.read().decode().strip()
+            # User
+            # Modified command to get full 'w' output for more structured parsing
+            stdin, stdout, stderr = ssh.exec_command("w")
+            users_output = stdout.read().decode().strip()
         
-        active_users_parsed = []
-        if users_output:
-            lines = users_output.splitlines()
-            if len(lines) > 2: # Skip header lines
-                for line in lines[2:]:
-                    parts = line.split(maxsplit=7) # Split into at most 8 parts
-                    if len(parts) >= 4: # Ensure basic parts are present
-                        username = parts[0]
-                        tty = parts[1] if len(parts) > 1 else None
-                        from_host = parts[2] if len(parts) > 2 else None
-                        login_time = parts[3] if len(parts) > 3 else None
-                        idle_time = parts[4] if len(parts) > 4 else None
-                        what = parts[7] if len(parts) > 7 else None # The 'WHAT' column can contain spaces
-
-                        active_users_parsed.append(ActiveUser(
-                            username=username,
-                            tty=tty,
-                            from_host=from_host,
-                            login_time=login_time,
-                            idle_time=idle_time,
-                            what=what
-                        ))
-                    else:
-                        logger.warning(f"[STATS][SSH] Unexpected 'w' output format for line: {line}")
-            else:
-                logger.warning(f"[STATS][SSH] 'w' command returned less than 3 lines of output.")
-        ssh.close()
+            active_users_parsed = []
+            if users_output:
+                lines = users_output.splitlines()
+                if len(lines) > 2: # Skip header lines
+                    for line in lines[2:]:
+                        parts = line.split(maxsplit=7) # Split into at most 8 parts
+                        if len(parts) >= 4: # Ensure basic parts are present
+                            username = parts[0]
+                            tty = parts[1] if len(parts) > 1 else None
+                            from_host = parts[2] if len(parts) > 2 else None
+                            login_time = parts[3] if len(parts) > 3 else None
+                            idle_time = parts[4] if len(parts) > 4 else None
+                            what = parts[7] if len(parts) > 7 else None # The 'WHAT' column can contain spaces
+
+                            active_users_parsed.append(ActiveUser(
+                                username=username,
+                                tty=tty,
+                                from_host=from_host,
+                                login_time=login_time,
+                                idle_time=idle_time,
+                                what=what
+                            ))
+                        else:
+                            logger.warning(f"[STATS][SSH] Unexpected 'w' output format for line: {line}")
+                else:
+                    logger.warning(f"[STATS][SSH] 'w' command returned less than 3 lines of output.")
+            active_users = active_users_parsed
+
+            # Ressourcen pro User/Prozess – auf dem Host aggregiert, nur die Zusammenfassung wird übertragen.
+            # Eigener try, damit ein Fehler hier nicht die bereits gelesenen User verwirft.
+            try:
+                stdin, stdout, stderr = ssh.exec_command(RESOURCE_ACCOUNTING_CMD)
+                user_usage, top_processes = _parse_resource_accounting(stdout.read().decode())
+            except Exception as e:
+                logger.warning(f"[STATS][SSH] Fehler beim Ressourcen-Accounting auf {server.ip_address}: {e}")
+            usage_by_user = {usage.username: usage for usage in user_usage}
+            for active_user in active_users:
+                usage = usage_by_user.get(active_user.username)
+                if usage:
+                    active_user.cpu_percent = usage.cpu_percent
+                    active_user.rss_mb = usage.rss_mb
+                    active_user.gpu_memory_mb = usage.gpu_memory_mb
+                    active_user.process_count = usage.process_count
     except Exception as e:
         logger.warning(f"[STATS][SSH] Fehler bei der Abfrage von GPU/Usern auf {server.ip_address}: {e}")
 
     # --- Disk Information via SSH ---
     disk_partitions = []
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(server.ip_address, username=server.ssh_user, password=server.ssh_password, timeout=10)
+        with get_ssh_pool().connection(server) as ssh:
 
-        # Get block device information using lsblk
-        # Using -o for specific columns to make parsing more robust
-        lsblk_cmd = "lsblk -J -o NAME,MAJ:MIN,RM,RO,SIZE,STATE,FSTYPE,MOUNTPOINT,UUID,PARTUUID,PARTTYPE,LABEL,MODEL,SERIAL,TRAN,TYPE,PKNAME,VENDOR,REV,HOTPLUG,KNAME,WWN,SUBSYSTEMS"
-        stdin, stdout, stderr = ssh.exec_command(lsblk_cmd)
-        lsblk_output = stdout.read().decode().strip()
-        lsblk_error = stderr.read().decode().strip()
+            # Get block device information using lsblk
+            # Using -o for specific columns to make parsing more robust
+            lsblk_cmd = "lsblk -J -o NAME,MAJ:MIN,RM,RO,SIZE,STATE,FSTYPE,MOUNTPOINT,UUID,PARTUUID,PARTTYPE,LABEL,MODEL,SERIAL,TRAN,TYPE,PKNAME,VENDOR,REV,HOTPLUG,KNAME,WWN,SUBSYSTEMS"
+            stdin, stdout, stderr = ssh.exec_command(lsblk_cmd)
+            lsblk_output = stdout.read().decode().strip()
+            lsblk_error = stderr.read().decode().strip()
 
-        if lsblk_error:
-            logger.warning(f"[STATS][SSH] lsblk stderr: {lsblk_error}")
+            if lsblk_error:
+                logger.warning(f"[STATS][SSH] lsblk stderr: {lsblk_error}")
 
-        lsblk_data = json.loads(lsblk_output)
+            lsblk_data = json.loads(lsblk_output)
         
-        # Get disk usage information using df -h
-        df_cmd = "df -h --output=source,size,used,avail,pcent,target"
-        stdin, stdout, stderr = ssh.exec_command(df_cmd)
-        df_output = stdout.read().decode().strip()
-        df_error = stderr.read().decode().strip()
-
-        if df_error:
-            logger.warning(f"[STATS][SSH] df stderr: {df_error}")
-
-        df_data = {}
-        df_lines = df_output.splitlines()
-        if len(df_lines) > 1: # Skip header
-            for line in df_lines[1:]:
-                parts = line.split()
-                if len(parts) == 6:
-                    df_data[parts[0]] = {
-                        "size": parts[1],
-                        "used": parts[2],
-                        "available": parts[3],
-                        "use_percent": parts[4],
-                        "mountpoint": parts[5]
-                    }
+            # Get disk usage information using df -h
+            df_cmd = "df -h --output=source,size,used,avail,pcent,target"
+            stdin, stdout, stderr = ssh.exec_command(df_cmd)
+            df_output = stdout.read().decode().strip()
+            df_error = stderr.read().decode().strip()
+
+            if df_error:
+                logger.warning(f"[STATS][SSH] df stderr: {df_error}")
+
+            df_data = {}
+            df_lines = df_output.splitlines()
+            if len(df_lines) > 1: # Skip header
+                for line in df_lines[1:]:
+                    parts = line.split()
+                    if len(parts) == 6:
+                        df_data[parts[0]] = {
+                            "size": parts[1],
+                            "used": parts[2],
+                            "available": parts[3],
+                            "use_percent": parts[4],
+                            "mountpoint": parts[5]
+                        }
         
-        def parse_lsblk_device(device_data: Dict):
-            disk_info = DiskPartition(
-                name=device_data.get('name'),
-                maj_min=device_data.get('maj:min'),
-                rm=bool(device_data.get('rm')),
-                ro=bool(device_data.get('ro')),
-                size=device_data.get('size'),
-                state=device_data.get('state'),
-                fstype=device_data.get('fstype'),
-                mountpoint=device_data.get('mountpoint'),
-                uuid=device_data.get('uuid'),
-                partuuid=device_data.get('partuuid'),
-                parttype=device_data.get('parttype'),
-                label=device_data.get('label'),
-                model=device_data.get('model'),
-                serial=device_data.get('serial'),
-                tran=device_data.get('tran'),
-                type=device_data.get('type'),
-                pkname=device_data.get('pkname'),
-                vendor=device_data.get('vendor'),
-                rev=device_data.get('rev'),
-                hotplug=bool(device_data.get('hotplug')),
-                kname=device_data.get('kname'),
-                wwn=device_data.get('wwn'),
-                subsystems=device_data.get('subsystems')
-            )
-
-            # Check for LUKS
-            if disk_info.fstype == 'crypto_LUKS':
-                disk_info.luks = True
-                # To check if LUKS is unlocked, we'd need to parse `lsblk -o NAME,TYPE,MOUNTPOINT` and see if the decrypted device is mounted
-                # This is a more complex check, for now, we'll assume it's not explicitly unlocked unless we can confirm.
-                # A more robust check would involve `cryptsetup status <device>` or `lsblk -o NAME,TYPE,MOUNTPOINT` and checking for a mapped device.
-                # For simplicity, we'll leave luks_unlocked as False unless a specific check is added.
-                # Example: check if a device with type 'crypt' and a mountpoint exists, and its parent is this LUKS device.
-                # This would require another lsblk call or more complex parsing.
-
-            # Check for LVM
-            if disk_info.type == 'lvm':
-                disk_info.lvm = True
+            def parse_lsblk_device(device_data: Dict):
+                disk_info = DiskPartition(
+                    name=device_data.get('name'),
+                    maj_min=device_data.get('maj:min'),
+                    rm=bool(device_data.get('rm')),
+                    ro=bool(device_data.get('ro')),
+                    size=device_data.get('size'),
+                    state=device_data.get('state'),
+                    fstype=device_data.get('fstype'),
+                    mountpoint=device_data.get('mountpoint'),
+                    uuid=device_data.get('uuid'),
+                    partuuid=device_data.get('partuuid'),
+                    parttype=device_data.get('parttype'),
+                    label=device_data.get('label'),
+                    model=device_data.get('model'),
+                    serial=device_data.get('serial'),
+                    tran=device_data.get('tran'),
+                    type=device_data.get('type'),
+                    pkname=device_data.get('pkname'),
+                    vendor=device_data.get('vendor'),
+                    rev=device_data.get('rev'),
+                    hotplug=bool(device_data.get('hotplug')),
+                    kname=device_data.get('kname'),
+                    wwn=device_data.get('wwn'),
+                    subsystems=device_data.get('subsystems')
+                )
+
+                # Check for LUKS
+                if disk_info.fstype == 'crypto_LUKS':
+                    disk_info.luks = True
+                    # To check if LUKS is unlocked, we'd need to parse `lsblk -o NAME,TYPE,MOUNTPOINT` and see if the decrypted device is mounted
+                    # This is a more complex check, for now, we'll assume it's not explicitly unlocked unless we can confirm.
+                    # A more robust check would involve `cryptsetup status <device>` or `lsblk -o NAME,TYPE,MOUNTPOINT` and checking for a mapped device.
+                    # For simplicity, we'll leave luks_unlocked as False unless a specific check is added.
+                    # Example: check if a device with type 'crypt' and a mountpoint exists, and its parent is this LUKS device.
+                    # This would require another lsblk call or more complex parsing.
+
+                # Check for LVM
+                if disk_info.type == 'lvm':
+                    disk_info.lvm = True
             
-            # Merge df data if available
-            if disk_info.mountpoint and disk_info.mountpoint in [d.get("mountpoint") for d in df_data.values()]:
-                # Find the df entry by mountpoint
-                df_entry = next((v for k, v in df_data.items() if v.get("mountpoint") == disk_info.mountpoint), None)
-                if df_entry:
-                    disk_info.size = df_entry.get("size")
-                    disk_info.used = df_entry.get("used")
-                    disk_info.available = df_entry.get("available")
-                    disk_info.use_percent = df_entry.get("use_percent")
+                # Merge df data if available
+                if disk_info.mountpoint and disk_info.mountpoint in [d.get("mountpoint") for d in df_data.values()]:
+                    # Find the df entry by mountpoint
+                    df_entry = next((v for k, v in df_data.items() if v.get("mountpoint") == disk_info.mountpoint), None)
+                    if df_entry:
+                        disk_info.size = df_entry.get("size")
+                        disk_info.used = df_entry.get("used")
+                        disk_info.available = df_entry.get("available")
+                        disk_info.use_percent = df_entry.get("use_percent")
             
-            return disk_info
+                return disk_info
 
-        if 'blockdevices' in lsblk_data:
-            for device in lsblk_data['blockdevices']:
-                disk_partitions.append(parse_lsblk_device(device))
-                if 'children' in device:
-                    for child in device['children']:
-                        disk_partitions.append(parse_lsblk_device(child))
+            if 'blockdevices' in lsblk_data:
+                for device in lsblk_data['blockdevices']:
+                    disk_partitions.append(parse_lsblk_device(device))
+                    if 'children' in device:
+                        for child in device['children']:
+                            disk_partitions.append(parse_lsblk_device(child))
 
-        ssh.close()
     except Exception as e:
         logger.warning(f"[STATS][SSH] Fehler bei der Abfrage von Disk-Informationen auf {server.ip_address}: {e}")
         
@@ -868,5 +2854,513 @@ async def get_server_stats(server_id: int):
         memory_percent=round(memory_percent, 2),
         gpu_stats=gpu_stats,
         active_users=active_users,
-        disk_partitions=disk_partitions
+        disk_partitions=disk_partitions,
+        user_usage=user_usage,
+        top_processes=top_processes,
+        collected_at=datetime.utcnow()
     )
+
+# === FLEET ALERTS (VECTORIZED RULE EVALUATION) ===
+
+# Metrik-Familien: jede Familie ist eine Spalten-Matrix (Serien x Metriken)
+ALERT_FAMILIES = {
+    "host": ["cpu_percent", "memory_percent"],
+    "gpu": ["gpu.utilization", "gpu.temperature", "gpu.memory_percent", "gpu.power_draw"],
+    "disk": ["disk.use_percent"],
+}
+ALERT_METRICS = {metric: (family, column) for family, metrics in ALERT_FAMILIES.items() for column, metric in enumerate(metrics)}
+ALERT_OPERATORS = {">": "greater", ">=": "greater_equal", "<": "less", "<=": "less_equal"} # NumPy-ufuncs
+ALERT_STALE_AFTER = float(os.environ.get("ALERT_STALE_AFTER", str(MAX_POLL_INTERVAL * 3))) # Ältere Werte werden ignoriert
+ALERT_RULE_RELOAD_INTERVAL = 10.0
+
+def _alert_series(stats: SystemStats) -> Dict[str, Dict[str, List[float]]]:
+    """Zerlegt einen Stats-Snapshot in Serien je Familie: {familie: {serie: [werte]}}."""
+    nan = float("nan")
+    gpus = {}
+    for index, gpu in enumerate(stats.gpu_stats):
+        gpus[gpu.pci_bus_id or f"gpu{index}"] = [
+            gpu.utilization_gpu,
+            gpu.temperature_gpu if gpu.temperature_gpu is not None else nan,
+            gpu.memory_used / gpu.memory_total * 100 if gpu.memory_total else nan,
+            gpu.power_draw if gpu.power_draw is not None else nan,
+        ]
+    disks = {}
+    for disk in stats.disk_partitions:
+        if disk.mountpoint and disk.use_percent:
+            try:
+                disks[disk.mountpoint] = [float(disk.use_percent.rstrip('%'))]
+            except ValueError:
+                pass
+    return {"host": {"": [stats.cpu_percent, stats.memory_percent]}, "gpu": gpus, "disk": disks}
+
+class _MetricFamily:
+    """
+    Spaltenspeicher für eine Metrik-Familie: 'values' ist (Metriken x Serien), Serien sind
+    (server_id, label). Dazu pro Regel und Serie der Beginn einer Überschreitung ('since').
+    Freie Serien-Slots werden wiederverwendet, die Kapazität verdoppelt sich bei Bedarf.
+    """
+
+    def __init__(self, metrics: List[str]):
+        self.metrics = metrics
+        self.values = np.full((len(metrics), 0), np.nan)
+        self.updated_at = np.full(0, -np.inf)
+        self.keys: List[Optional[Tuple[int, str]]] = []
+        self.rows: Dict[Tuple[int, str], int] = {}
+        self.labels_by_server: Dict[int, Set[str]] = {}
+        self.free: List[int] = []
+        self.rule_ids: List[int] = []
+        self.columns = np.zeros(0, dtype=int)
+        self.durations = np.zeros(0)
+        self.rule_groups: List[Tuple[np.ufunc, int, np.ndarray, np.ndarray]] = [] # (operator, metric, rule rows, thresholds)
+        self.since = np.full((0, 0), np.nan) # (rules x series)
+        self.breaching = np.zeros((0, 0), dtype=bool) # Result of the previous evaluation
+        self.pending = False # Breaches that have not yet lasted long enough
+
+    def _allocate(self, key: Tuple[int, str]) -> int:
+        if self.free:
+            row = self.free.pop()
+        else:
+            row = len(self.keys)
+            self.keys.append(None)
+            if row >= self.values.shape[1]:
+                pad = max(16, self.values.shape[1])
+                self.values = np.hstack([self.values, np.full((len(self.metrics), pad), np.nan)])
+                self.updated_at = np.concatenate([self.updated_at, np.full(pad, -np.inf)])
+                self.since = np.hstack([self.since, np.full((len(self.rule_ids), pad), np.nan)])
+                self.breaching = np.hstack([self.breaching, np.zeros((len(self.rule_ids), pad), dtype=bool)])
+        self.keys[row] = key
+        self.rows[key] = row
+        return row
+
+    def _release(self, key: Tuple[int, str]):
+        row = self.rows.pop(key)
+        self.keys[row] = None
+        self.values[:, row] = np.nan
+        self.updated_at[row] = -np.inf
+        self.since[:, row] = np.nan
+        self.breaching[:, row] = False
+        self.free.append(row)
+
+    def update_server(self, server_id: int, series: Dict[str, List[float]], now: float):
+        for label in self.labels_by_server.get(server_id, set()) - set(series):
+            self._release((server_id, label))
+        for label, values in series.items():
+            key = (server_id, label)
+            row = self.rows.get(key)
+            if row is None:
+                row = self._allocate(key)
+            self.values[:, row] = values
+            self.updated_at[row] = now
+        if series:
+            self.labels_by_server[server_id] = set(series)
+        else:
+            self.labels_by_server.pop(server_id, None)
+
+    def set_rules(self, rules: List[AlertRule]):
+        # Keep breach state for rules that survived the reload
+        capacity = self.values.shape[1]
+        since = np.full((len(rules), capacity), np.nan)
+        breaching = np.zeros((len(rules), capacity), dtype=bool)
+        previous = {rule_id: index for index, rule_id in enumerate(self.rule_ids)}
+        for index, rule in enumerate(rules):
+            if rule.id in previous:
+                since[index] = self.since[previous[rule.id]]
+                breaching[index] = self.breaching[previous[rule.id]]
+        self.since = since
+        self.breaching = breaching
+        self.rule_ids = [rule.id for rule in rules]
+        self.columns = np.array([ALERT_METRICS[rule.metric][1] for rule in rules], dtype=int)
+        self.durations = np.array([rule.duration_seconds or 0 for rule in rules], dtype=float)
+
+        thresholds = np.array([rule.threshold for rule in rules], dtype=float)
+        grouped: Dict[Tuple[str, int], List[int]] = {}
+        for index, rule in enumerate(rules):
+            grouped.setdefault((rule.operator, int(self.columns[index])), []).append(index)
+        self.rule_groups = [
+            (getattr(np, ALERT_OPERATORS[operator]), column, np.array(rule_rows), thresholds[rule_rows, None])
+            for (operator, column), rule_rows in grouped.items()
+        ]
+
+    def evaluate(self, now: float):
+        """
+        Wertet alle Regeln der Familie auf einmal aus. Gibt (Regel-Zeilen, Serien-Zeilen, feuert)
+        für alle aktuell überschrittenen Zellen zurück.
+        """
+        if not self.rule_ids or not self.rows:
+            self.pending = False
+            return None
+        values = self.values
+        stale = self.updated_at < now - ALERT_STALE_AFTER
+        if stale.any():
+            values = values.copy()
+            values[:, stale] = np.nan
+
+        # One broadcast comparison per (operator, metric): thresholds (k x 1) against values (1 x series)
+        breaching = np.empty_like(self.breaching)
+        for operator, column, rule_rows, thresholds in self.rule_groups:
+            breaching[rule_rows] = operator(values[column][None, :], thresholds)
+
+        # Only cells whose state flipped need their breach start time updated
+        changed = np.flatnonzero(breaching ^ self.breaching)
+        if changed.size:
+            self.since.flat[changed] = np.where(breaching.flat[changed], now, np.nan)
+        self.breaching = breaching
+
+        flat = np.flatnonzero(breaching)
+        rule_rows, series_rows = np.divmod(flat, breaching.shape[1])
+        firing = self.since.flat[flat] <= now - self.durations[rule_rows]
+        self.pending = not firing.all()
+        return rule_rows, series_rows, firing
+
+    def value(self, rule_row: int, series_row: int) -> float:
+        return float(self.values[self.columns[rule_row], series_row])
+
+class AlertEngine:
+    """
+    Wertet alle Alert-Regeln über die letzten Werte der gesamten Flotte aus (läuft im Collector-Leader).
+    Ausgelöste Alerts werden dedupliziert in active_alerts geschrieben – nur bei Zustandswechseln.
+    Ein Alert bleibt aktiv, solange die Bedingung erfüllt ist.
+    """
+
+    def __init__(self):
+        self.families = {name: _MetricFamily(metrics) for name, metrics in ALERT_FAMILIES.items()}
+        self.active: Optional[Set[Tuple[int, int, str]]] = None # Loaded from the DB on first evaluation
+        self.dirty = False
+        self._rules_loaded_at = float("-inf")
+
+    def observe(self, server_id: int, stats: SystemStats):
+        now = time.time()
+        for name, series in _alert_series(stats).items():
+            self.families[name].update_server(server_id, series, now)
+        self.dirty = True
+
+    def forget_server(self, server_id: int):
+        for family in self.families.values():
+            family.update_server(server_id, {}, time.time())
+        self.dirty = True
+
+    @staticmethod
+    def _read_state(load_active: bool):
+        """Liest die aktiven Regeln und beim ersten Mal die ausgelösten Alerts (blockierend, im Threadpool)."""
+        db = SessionLocal()
+        try:
+            rules = db.query(AlertRule).filter(AlertRule.enabled == True).order_by(AlertRule.id).all()
+            active = {(a.rule_id, a.server_id, a.series) for a in db.query(ActiveAlert).all()} if load_active else None
+        finally:
+            db.close()
+        return rules, active
+
+    def _set_rules(self, rules: List[AlertRule]):
+        for name, family in self.families.items():
+            family.set_rules([
+                rule for rule in rules
+                if rule.metric in ALERT_METRICS and ALERT_METRICS[rule.metric][0] == name and rule.operator in ALERT_OPERATORS
+            ])
+        self._rules_loaded_at = time.monotonic()
+        self.dirty = True
+
+    @staticmethod
+    def _write_changes(started: Dict[Tuple[int, int, str], Tuple[float, float]], resolved: List[Tuple[int, int, str]]):
+        """Schreibt Zustandswechsel nach active_alerts (blockierend, im Threadpool)."""
+        db = SessionLocal()
+        try:
+            for rule_id, server_id, label in resolved:
+                db.query(ActiveAlert).filter(
+                    ActiveAlert.rule_id == rule_id, ActiveAlert.server_id == server_id, ActiveAlert.series == label
+                ).delete()
+            for (rule_id, server_id, label), (value, since) in started.items():
+                db.add(ActiveAlert(rule_id=rule_id, server_id=server_id, series=label, value=value,
+                                   since=datetime.utcfromtimestamp(since)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def evaluate(self):
+        """
+        Die NumPy-Auswertung läuft auf dem Event-Loop (kurz, und observe() darf nicht
+        dazwischenfunken), alle Datenbankzugriffe im Threadpool.
+        """
+        if self.active is None or time.monotonic() - self._rules_loaded_at >= ALERT_RULE_RELOAD_INTERVAL:
+            rules, active = await run_in_threadpool(self._read_state, self.active is None)
+            self._set_rules(rules)
+            if active is not None:
+                self.active = active
+        if not self.dirty and not any(family.pending for family in self.families.values()):
+            return
+
+        now = time.time()
+        breaching_keys: Set[Tuple[int, int, str]] = set()
+        firing: Dict[Tuple[int, int, str], Tuple[float, float]] = {}
+        for family in self.families.values():
+            result = family.evaluate(now)
+            if result is None:
+                continue
+            for rule_row, series_row, is_firing in zip(*result):
+                server_id, label = family.keys[series_row]
+                key = (family.rule_ids[rule_row], server_id, label)
+                breaching_keys.add(key)
+                if is_firing:
+                    firing[key] = (family.value(rule_row, series_row), float(family.since[rule_row, series_row]))
+        self.dirty = False
+
+        started = [key for key in firing if key not in self.active]
+        resolved = [key for key in self.active if key not in breaching_keys]
+        if not started and not resolved:
+            return
+
+        try:
+            await run_in_threadpool(self._write_changes, {key: firing[key] for key in started}, resolved)
+        except Exception:
+            self.active = None # Resync with the database on the next evaluation
+            raise
+        self.active.difference_update(resolved)
+        self.active.update(started)
+        logger.info(f"[ALERTS] {len(started)} neue, {len(resolved)} aufgelöste Alerts.")
+
+@router.get("/alerts", response_model=List[ActiveAlertResponse])
+async def list_active_alerts(server_id: Optional[int] = None, severity: Optional[str] = None):
+    """
+    Listet die aktuell ausgelösten Alerts der gesamten Flotte.
+    """
+    db = SessionLocal()
+    query = (
+        db.query(ActiveAlert, AlertRule, Server.name)
+        .join(AlertRule, AlertRule.id == ActiveAlert.rule_id)
+        .join(Server, Server.id == ActiveAlert.server_id)
+    )
+    if server_id is not None:
+        query = query.filter(ActiveAlert.server_id == server_id)
+    if severity is not None:
+        query = query.filter(AlertRule.severity == severity)
+    rows = query.order_by(ActiveAlert.since).all()
+    db.close()
+    return [
+        ActiveAlertResponse(
+            rule_id=rule.id,
+            rule_name=rule.name,
+            severity=rule.severity,
+            metric=rule.metric,
+            operator=rule.operator,
+            threshold=rule.threshold,
+            server_id=alert.server_id,
+            server_name=server_name,
+            series=alert.series,
+            value=alert.value,
+            since=alert.since,
+        )
+        for alert, rule, server_name in rows
+    ]
+
+@router.get("/alerts/rules", response_model=List[AlertRuleResponse])
+async def list_alert_rules():
+    db = SessionLocal()
+    rules = db.query(AlertRule).order_by(AlertRule.id).all()
+    db.close()
+    return rules
+
+@router.post("/alerts/rules", response_model=AlertRuleResponse, status_code=201)
+async def create_alert_rule(rule: AlertRuleCreate):
+    """
+    Legt eine Alert-Regel an, z.B. {"metric": "gpu.temperature", "operator": ">", "threshold": 85,
+    "duration_seconds": 120}. Der Collector übernimmt neue Regeln innerhalb von 10 Sekunden.
+    """
+    if rule.metric not in ALERT_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric. Valid: {', '.join(ALERT_METRICS)}")
+    if rule.operator not in ALERT_OPERATORS:
+        raise HTTPException(status_code=400, detail=f"Unknown operator. Valid: {', '.join(ALERT_OPERATORS)}")
+    if rule.duration_seconds < 0:
+        raise HTTPException(status_code=400, detail="duration_seconds must not be negative.")
+    db = SessionLocal()
+    db_rule = AlertRule(**rule.dict())
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    db.close()
+    return db_rule
+
+@router.delete("/alerts/rules/{rule_id}", status_code=204)
+async def delete_alert_rule(rule_id: int):
+    db = SessionLocal()
+    db_rule = db.query(AlertRule).filter(AlertRule.id == rule_id).first()
+    if not db_rule:
+        db.close()
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    db.query(ActiveAlert).filter(ActiveAlert.rule_id == rule_id).delete()
+    db.delete(db_rule)
+    db.commit()
+    db.close()
+    return
+
+# === COMPACT STATS RESPONSES ===
+
+# Kurznamen für ?sections=, ein vorangestelltes '-' schließt eine Sektion aus (z.B. sections=-disks)
+STATS_SECTIONS = {
+    "cpu": ["cpu_percent"],
+    "memory": ["memory_percent"],
+    "gpu": ["gpu_stats"],
+    "users": ["active_users"],
+    "disks": ["disk_partitions"],
+    "accounting": ["user_usage", "top_processes"],
+}
+COMPRESSION_MIN_SIZE = 512 # Bytes; kleinere Antworten werden unkomprimiert gesendet
+
+def _stats_include(fields: Optional[str], sections: Optional[str]) -> Optional[Dict]:
+    """
+    Übersetzt ?sections= und ?fields= in ein Pydantic-include. Felder in Listen werden
+    mit Punkt adressiert, z.B. fields=cpu_percent,disk_partitions.name,disk_partitions.use_percent
+    """
+    include: Dict = {}
+    if sections:
+        wanted = [section.strip() for section in sections.split(',') if section.strip()]
+        unknown = [section for section in wanted if section.lstrip('-') not in STATS_SECTIONS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}. Valid: {', '.join(STATS_SECTIONS)}")
+        excluded = {name for section in wanted if section.startswith('-') for name in STATS_SECTIONS[section[1:]]}
+        selected = {name for section in wanted if not section.startswith('-') for name in STATS_SECTIONS[section]}
+        for field_name in (selected or set(SystemStats.__fields__)) - excluded:
+            include[field_name] = True
+    if fields:
+        for field in (f.strip() for f in fields.split(',') if f.strip()):
+            top, _, sub = field.partition('.')
+            model_field = SystemStats.__fields__.get(top)
+            if model_field is None or (sub and sub not in getattr(model_field.type_, "__fields__", {})):
+                raise HTTPException(status_code=400, detail=f"Unknown field: {field}")
+            if not sub:
+                include[top] = True
+            elif include.get(top) is not True:
+                include.setdefault(top, {"__all__": set()})["__all__"].add(sub)
+    if include:
+        include["collected_at"] = True # Clients müssen immer sehen, wie alt die Werte sind
+    return include or None
+
+def _accepted_encodings(request: Request) -> Set[str]:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding and params.replace(' ', '') not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.lower())
+    return accepted
+
+def _compact_json_response(request: Request, payload: Dict) -> Response:
+    body = orjson.dumps(payload) if orjson is not None else json.dumps(payload, separators=(',', ':')).encode()
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        accepted = _accepted_encodings(request)
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/servers/{server_id}/stats", response_model=SystemStats, response_model_exclude_none=True)
+async def get_server_stats(server_id: int, request: Request, fields: Optional[str] = None, sections: Optional[str] = None):
+    """
+    Liefert Systemstatistiken aus dem gemeinsamen Cache, auch wenn sie älter sind (siehe
+    collected_at): der Aufruf markiert den Host als angesehen, der Leader zieht dessen
+    Abfrage dann vor. Live abgefragt wird nur, wenn es noch gar keinen Eintrag gibt.
+    Mit ?sections=cpu,memory bzw. ?sections=-disks oder ?fields=... wird nur ein Teil geliefert;
+    None-Felder werden weggelassen, die Antwort wird per gzip/brotli komprimiert.
+    """
+    include = _stats_include(fields, sections)
+    server = get_server_from_db(server_id)
+    _record_view(server_id)
+    stats = _load_cached_stats(server_id)
+    if stats is None:
+        stats = await _collect_first_stats(server)
+    if stats is None:
+        raise HTTPException(status_code=503, detail="Stats are being collected, try again shortly.",
+                            headers={"Retry-After": "5"})
+
+    payload = stats.dict(include=include, exclude_none=True)
+    payload["collected_at"] = stats.collected_at.isoformat()
+    return _compact_json_response(request, payload)
+
+# === APP FACTORY, STARTUP & PROBES ===
+
+DB_INIT_RETRY_INTERVAL = float(os.environ.get("DB_INIT_RETRY_INTERVAL", "2")) # Sekunden
+
+def _ping_db():
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+    finally:
+        db.close()
+
+async def _start_subsystems(app: FastAPI):
+    """
+    Legt die Tabellen an, sobald die Datenbank erreichbar ist (ersetzt wait-for-it.sh),
+    und startet danach den Collector. Bis dahin meldet /readyz 503.
+    """
+    while True:
+        try:
+            await run_in_threadpool(init_db)
+            break
+        except Exception as e:
+            logger.warning(f"[STARTUP] Datenbank nicht erreichbar ({e}), neuer Versuch in {DB_INIT_RETRY_INTERVAL}s.")
+            await asyncio.sleep(DB_INIT_RETRY_INTERVAL)
+    app.state.db_ready = True
+    logger.info("[STARTUP] Datenbank bereit.")
+    if COLLECTOR_ENABLED:
+        app.state.collector = asyncio.create_task(_collector_loop())
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: der Prozess läuft und bedient Anfragen."""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz(request: Request):
+    """Readiness: die Tabellen sind angelegt und die Datenbank antwortet."""
+    if not getattr(request.app.state, "db_ready", False):
+        raise HTTPException(status_code=503, detail="Database not initialized yet.")
+    try:
+        await run_in_threadpool(_ping_db)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unreachable: {str(e)}")
+    return {"status": "ready"}
+
+def create_app() -> FastAPI:
+    """
+    Baut die App. Der Import dieses Moduls berührt weder Datenbank noch Netzwerk; die DB wird
+    beim Start initialisiert, SSH-Pool, Netdata- und Fritz!Box-Clients beim ersten Bedarf.
+    """
+    app = FastAPI()
+
+    # CORS Middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*", "http://localhost:3000", "http://10.0.0.107:3000"],  # Erlaubt alle Ursprünge, aber du kannst hier spezifische URLs angeben
+        allow_origin_regex="https?://.*",  # Erlaubt alle HTTP/HTTPS Ursprünge
+        max_age=3600,  # Caching der CORS-Preflight-Anfrage
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+
+    @app.on_event("startup")
+    async def start_subsystems():
+        app.state.db_ready = False
+        get_engine()
+        app.state.startup = asyncio.create_task(_start_subsystems(app))
+
+    @app.on_event("shutdown")
+    async def stop_subsystems():
+        for name in ("startup", "collector"):
+            task = getattr(app.state, name, None)
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await run_in_threadpool(close_clients)
+
+    return app
+
+app = create_app()
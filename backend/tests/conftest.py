@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Eigene SQLite-Datei statt ./test.db, muss vor dem Import von src.main gesetzt sein
+_db_dir = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+
+from src import main  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    main.init_db()
+    session = main.SessionLocal()
+    yield session
+    session.close()
+    cleanup = main.SessionLocal()
+    for table in reversed(main.Base.metadata.sorted_tables):
+        cleanup.execute(table.delete())
+    cleanup.commit()
+    cleanup.close()
@@ -0,0 +1,153 @@
+import asyncio
+import math
+import threading
+
+from src import main
+from src.main import (
+    ActiveAlert, AlertEngine, AlertRule, ALERT_FAMILIES, ALERT_STALE_AFTER, GpuStats, SystemStats, _MetricFamily,
+)
+
+
+def rule(rule_id, metric, threshold, operator=">", duration=0):
+    return AlertRule(id=rule_id, metric=metric, operator=operator, threshold=threshold, duration_seconds=duration)
+
+
+def firing_cells(family, now):
+    rule_rows, series_rows, firing = family.evaluate(now)
+    return {(family.rule_ids[r], family.keys[s], bool(f)) for r, s, f in zip(rule_rows, series_rows, firing)}
+
+
+def gpu_stats(*temperatures, cpu_percent=10.0):
+    gpus = [GpuStats(name="gpu", utilization_gpu=0, memory_used=0, memory_total=100, temperature_gpu=t,
+                     power_draw=0, power_limit=0, pci_bus_id=f"0000:0{i}:00.0") for i, t in enumerate(temperatures)]
+    return SystemStats(cpu_percent=cpu_percent, memory_percent=0, gpu_stats=gpus, active_users=[], disk_partitions=[])
+
+
+def test_released_slot_is_reused_without_old_breach():
+    family = _MetricFamily(ALERT_FAMILIES["gpu"])
+    family.set_rules([rule(1, "gpu.temperature", 80)])
+    family.update_server(1, {"a": [0, 90, 0, 0], "b": [0, 90, 0, 0]}, now=0)
+    assert firing_cells(family, 0) == {(1, (1, "a"), True), (1, (1, "b"), True)}
+
+    family.update_server(1, {"a": [0, 90, 0, 0]}, now=1)
+    freed = family.free[-1]
+    family.update_server(2, {"c": [0, 50, 0, 0]}, now=1)
+    assert family.rows[(2, "c")] == freed
+    assert math.isnan(family.since[0, freed])
+    assert firing_cells(family, 1) == {(1, (1, "a"), True)}
+
+
+def test_capacity_grows_past_initial_slots():
+    family = _MetricFamily(ALERT_FAMILIES["disk"])
+    family.set_rules([rule(1, "disk.use_percent", 90)])
+    family.update_server(1, {f"/mnt/{i}": [95] for i in range(40)}, now=0)
+    assert family.values.shape[1] >= 40
+    assert family.since.shape == (1, family.values.shape[1])
+    assert len(firing_cells(family, 0)) == 40
+
+
+def test_duration_window_delays_firing():
+    family = _MetricFamily(ALERT_FAMILIES["host"])
+    family.set_rules([rule(1, "cpu_percent", 90, duration=60)])
+    family.update_server(1, {"": [95, 0]}, now=0)
+    assert firing_cells(family, 0) == {(1, (1, ""), False)}
+    assert family.pending
+
+    family.update_server(1, {"": [95, 0]}, now=59)
+    assert firing_cells(family, 59) == {(1, (1, ""), False)}
+    family.update_server(1, {"": [95, 0]}, now=60)
+    assert firing_cells(family, 60) == {(1, (1, ""), True)}
+    assert not family.pending
+
+
+def test_recovery_restarts_duration_window():
+    family = _MetricFamily(ALERT_FAMILIES["host"])
+    family.set_rules([rule(1, "cpu_percent", 90, duration=60)])
+    family.update_server(1, {"": [95, 0]}, now=0)
+    family.evaluate(0)
+    family.update_server(1, {"": [50, 0]}, now=30)
+    assert firing_cells(family, 30) == set()
+    family.update_server(1, {"": [95, 0]}, now=40)
+    family.evaluate(40)
+    family.update_server(1, {"": [95, 0]}, now=70)
+    assert firing_cells(family, 70) == {(1, (1, ""), False)}
+
+
+def test_stale_values_do_not_breach():
+    family = _MetricFamily(ALERT_FAMILIES["host"])
+    family.set_rules([rule(1, "cpu_percent", 90)])
+    family.update_server(1, {"": [95, 0]}, now=0)
+    assert firing_cells(family, ALERT_STALE_AFTER + 1) == set()
+
+
+def test_rule_reload_keeps_breach_start():
+    family = _MetricFamily(ALERT_FAMILIES["host"])
+    family.set_rules([rule(1, "cpu_percent", 90, duration=60)])
+    family.update_server(1, {"": [95, 95]}, now=0)
+    family.evaluate(0)
+
+    family.set_rules([rule(2, "memory_percent", 90, duration=60), rule(1, "cpu_percent", 90, duration=60)])
+    family.update_server(1, {"": [95, 95]}, now=60)
+    assert firing_cells(family, 60) == {(1, (1, ""), True), (2, (1, ""), False)}
+
+
+def test_engine_dedups_active_alerts_across_reloads_and_restarts(db):
+    db.add(AlertRule(id=1, name="hot gpu", metric="gpu.temperature", operator=">", threshold=80, enabled=True))
+    db.commit()
+
+    engine = AlertEngine()
+    engine.observe(1, gpu_stats(90, 50))
+    asyncio.run(engine.evaluate())
+    alerts = db.query(ActiveAlert).all()
+    assert [(a.rule_id, a.server_id, a.series) for a in alerts] == [(1, 1, "0000:00:00.0")]
+    since = alerts[0].since
+
+    engine._rules_loaded_at = float("-inf") # Force a rule reload
+    engine.observe(1, gpu_stats(91, 50))
+    asyncio.run(engine.evaluate())
+
+    restarted = AlertEngine()
+    restarted.observe(1, gpu_stats(92, 50))
+    asyncio.run(restarted.evaluate())
+
+    db.expire_all()
+    alerts = db.query(ActiveAlert).all()
+    assert [(a.rule_id, a.server_id, a.series, a.since) for a in alerts] == [(1, 1, "0000:00:00.0", since)]
+
+
+def test_engine_resolves_alerts(db):
+    db.add(AlertRule(id=1, name="busy", metric="cpu_percent", operator=">=", threshold=90, enabled=True))
+    db.commit()
+
+    engine = AlertEngine()
+    engine.observe(1, gpu_stats(cpu_percent=95))
+    asyncio.run(engine.evaluate())
+    assert db.query(ActiveAlert).count() == 1
+
+    engine.observe(1, gpu_stats(cpu_percent=20))
+    asyncio.run(engine.evaluate())
+    assert db.query(ActiveAlert).count() == 0
+
+    engine.observe(1, gpu_stats(cpu_percent=95))
+    asyncio.run(engine.evaluate())
+    engine.forget_server(1)
+    asyncio.run(engine.evaluate())
+    assert db.query(ActiveAlert).count() == 0
+
+
+def test_engine_keeps_database_work_off_the_event_loop(db, monkeypatch):
+    db.add(AlertRule(id=1, name="busy", metric="cpu_percent", operator=">=", threshold=90, enabled=True))
+    db.commit()
+    session_threads = []
+    session_factory = main.SessionLocal
+
+    def recording_session():
+        session_threads.append(threading.current_thread())
+        return session_factory()
+
+    monkeypatch.setattr(main, "SessionLocal", recording_session)
+    engine = AlertEngine()
+    engine.observe(1, gpu_stats(cpu_percent=95))
+    asyncio.run(engine.evaluate())
+    assert len(session_threads) == 2 # Load rules/active alerts, then write the new alert
+    assert threading.main_thread() not in session_threads
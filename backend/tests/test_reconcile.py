@@ -0,0 +1,108 @@
+import pytest
+from fastapi import HTTPException
+
+from src.main import DesiredGroup, DesiredUser, ReconcileRequest, _plan_reconciliation
+
+PASSWD = {
+    "root": {"uid": 0, "gid": 0},
+    "daemon": {"uid": 1, "gid": 1},
+    "alice": {"uid": 1000, "gid": 1000},
+    "bob": {"uid": 1001, "gid": 1001},
+    "nobody": {"uid": 65534, "gid": 65534},
+}
+GROUPS = {
+    "root": {"gid": 0, "members": []},
+    "sudo": {"gid": 27, "members": ["alice"]},
+    "alice": {"gid": 1000, "members": []},
+    "bob": {"gid": 1001, "members": []},
+    "devs": {"gid": 1002, "members": ["alice", "bob"]},
+    "nogroup": {"gid": 65534, "members": []},
+}
+
+
+def plan(**desired):
+    changes, credentials = _plan_reconciliation(ReconcileRequest(**desired), PASSWD, GROUPS)
+    return [(change.action, change.target, command) for change, command in changes], credentials
+
+
+def test_converged_state_has_no_changes():
+    assert plan(users=[DesiredUser(username="alice", uid=1000)]) == ([], [])
+
+
+def test_is_admin_none_keeps_sudo_membership():
+    changes, _ = plan(users=[DesiredUser(username="alice", group_names=[])])
+    assert ("remove_group", "alice:devs", "gpasswd -d alice devs") in changes
+    assert not any(target == "alice:sudo" for _, target, _ in changes)
+
+
+def test_is_admin_false_removes_admin_groups():
+    changes, _ = plan(users=[DesiredUser(username="alice", is_admin=False)])
+    assert changes == [("remove_group", "alice:sudo", "gpasswd -d alice sudo")]
+
+
+def test_is_admin_true_adds_sudo():
+    changes, _ = plan(users=[DesiredUser(username="bob", is_admin=True)])
+    assert changes == [("add_groups", "bob", "usermod -aG sudo bob")]
+
+
+def test_is_admin_without_sudo_group_is_rejected():
+    groups = {name: entry for name, entry in GROUPS.items() if name != "sudo"}
+    with pytest.raises(HTTPException) as error:
+        _plan_reconciliation(ReconcileRequest(users=[DesiredUser(username="bob", is_admin=True)]), PASSWD, groups)
+    assert error.value.status_code == 400
+    assert "sudo" in error.value.detail
+
+
+def test_new_user_password_only_in_credentials():
+    changes, credentials = plan(users=[DesiredUser(username="carol", password="s3cret'; rm -rf /", is_admin=True)])
+    assert [action for action, _, _ in changes] == ["create_user", "set_password"]
+    assert changes[0][2] == "useradd -m -G sudo carol"
+    assert credentials == ["carol:s3cret'; rm -rf /"]
+    assert all("s3cret" not in command for _, _, command in changes)
+
+
+@pytest.mark.parametrize("password", ["x\nroot:owned", "x\rroot:owned"])
+def test_password_with_line_break_is_rejected(password):
+    desired = ReconcileRequest(users=[DesiredUser(username="carol", password=password), DesiredUser(username="dave", password="pw")])
+    with pytest.raises(HTTPException) as error:
+        _plan_reconciliation(desired, PASSWD, GROUPS)
+    assert error.value.status_code == 400
+    assert "carol" in error.value.detail
+
+
+def test_prune_users_spares_system_accounts_and_nobody():
+    changes, _ = plan(users=[DesiredUser(username="alice")], prune_users=True)
+    assert [(action, target) for action, target, _ in changes] == [("delete_user", "bob")]
+
+
+def test_prune_groups_keeps_primary_groups_and_skips_removed_users():
+    changes, _ = plan(users=[DesiredUser(username="alice")], prune_users=True, prune_groups=True)
+    # bob's private group goes away with userdel -r, alice's is still her primary group
+    assert [(action, target) for action, target, _ in changes] == [("delete_user", "bob"), ("delete_group", "devs")]
+
+
+def test_prune_groups_alone_keeps_primary_groups():
+    changes, _ = plan(groups=[DesiredGroup(name="sudo")], prune_groups=True)
+    assert [(action, target) for action, target, _ in changes] == [("delete_group", "devs")]
+
+
+@pytest.mark.parametrize("desired, message", [
+    ({"users": [DesiredUser(username="carol", uid=1001)]}, "UID 1001 for carol is already used by bob"),
+    ({"users": [DesiredUser(username="alice", uid=1001)]}, "UID 1001 for alice is already used by bob"),
+    ({"groups": [DesiredGroup(name="ops", gid=1002)]}, "GID 1002 for ops is already used by devs"),
+    ({"users": [DesiredUser(username="carol", uid=2000), DesiredUser(username="dave", uid=2000)]},
+     "UID 2000 for dave is already used by carol"),
+])
+def test_id_conflicts_are_rejected(desired, message):
+    with pytest.raises(HTTPException) as error:
+        _plan_reconciliation(ReconcileRequest(**desired), PASSWD, GROUPS)
+    assert error.value.status_code == 400
+    assert message in error.value.detail
+
+
+def test_id_changes_without_conflict_are_planned():
+    changes, _ = plan(users=[DesiredUser(username="alice", uid=2000)], groups=[DesiredGroup(name="devs", gid=2002)])
+    assert changes == [
+        ("update_group", "devs", "groupmod -g 2002 devs"),
+        ("update_user", "alice", "usermod -u 2000 alice"),
+    ]